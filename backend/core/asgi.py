@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Async requests do not reuse a thread's connection, so persistent connections would pile up; opt in explicitly.
+os.environ.setdefault('PAYROLL_DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -1,7 +1,10 @@
 """
 Django settings for core project.
 """
+import os
+import tempfile
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-your-secret-key-here'
@@ -24,6 +27,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Per-endpoint latency/query/row histograms served at /api/metrics/
+    'payroll.middleware.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,12 +58,50 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'core.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# PAYROLL_DB selects the database: 'sqlite' (default, tuned for concurrent readers and one writer) or 'postgres'
+# (uploads bulk-load with COPY; needs psycopg 3). Connections are kept open for PAYROLL_DB_CONN_MAX_AGE seconds
+# (default 600; core.asgi defaults it to 0).
+DATABASE_BACKEND = os.environ.get('PAYROLL_DB', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('PAYROLL_DB_CONN_MAX_AGE', 600))
+
+if DATABASE_BACKEND == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('PAYROLL_DB_NAME', 'payroll'),
+            'USER': os.environ.get('PAYROLL_DB_USER', 'payroll'),
+            'PASSWORD': os.environ.get('PAYROLL_DB_PASSWORD', ''),
+            'HOST': os.environ.get('PAYROLL_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('PAYROLL_DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
-}
+elif DATABASE_BACKEND == 'sqlite':
+    # WAL lets dashboard reads run alongside an upload; IMMEDIATE transactions take the write lock up front so
+    # concurrent writers queue on the busy timeout instead of failing with "database is locked".
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': os.environ.get('PAYROLL_SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': -1024 * int(os.environ.get('PAYROLL_SQLITE_CACHE_MB', 64)),
+        'mmap_size': 1024 * 1024 * int(os.environ.get('PAYROLL_SQLITE_MMAP_MB', 256)),
+        'temp_store': 'MEMORY',
+    }
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('PAYROLL_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': float(os.environ.get('PAYROLL_DB_BUSY_TIMEOUT', 20)),
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"PAYROLL_DB must be 'sqlite' or 'postgres', not {DATABASE_BACKEND!r}.")
 
 AUTH_PASSWORD_VALIDATORS = [
     { 'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator', },
@@ -85,5 +128,14 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
 }
 
+# File-based so the web server and run_payroll_worker share the payroll data version (list response cache).
+# Kept outside the source tree; point PAYROLL_CACHE_DIR at the same directory for every process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('PAYROLL_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'payroll-cache')),
+    }
+}
+
 MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
@@ -3,7 +3,7 @@ from django.contrib import admin
 # Register your models here.
 # payroll/admin.py
 from django.contrib import admin
-from .models import Employee, Component, PayrollResult
+from .models import Employee, Component, PayrollResult, Job
 
 # This tells Django to show the Employee model on the admin site.
 @admin.register(Employee)
@@ -26,3 +26,9 @@ class PayrollResultAdmin(admin.ModelAdmin):
     search_fields = ('employee__employee_id', 'employee__name')
     readonly_fields = ('created_at',)
 
+# Background jobs queued by the upload/generate/archive endpoints.
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'state', 'rows_processed', 'created_at', 'finished_at')
+    list_filter = ('kind', 'state')
+    readonly_fields = ('created_at', 'started_at', 'heartbeat_at', 'finished_at')
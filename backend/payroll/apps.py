@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class PayrollConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payroll'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import caching  # noqa: F401  (connects the cache-invalidation signals)
+        from .middleware import install_query_recorder
+        connection_created.connect(install_query_recorder, dispatch_uid='payroll-query-recorder')
@@ -0,0 +1,193 @@
+# payroll/async_views.py
+"""
+Async-native versions of the endpoints the dashboard polls (results, history, employees, job status) and the
+write endpoints they would otherwise wait behind. Served through core.asgi, reads await Django's async ORM
+instead of holding a thread each, and uploads, generation and archiving run on a small dedicated thread pool,
+so neither blocks the event loop. The DRF views in payroll.views remain the single definition of filtering,
+field selection and output: a request these views do not answer natively (keyset pages, MessagePack, the
+browsable API, invalid parameters, 404s) is handed to the DRF view unchanged.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections, connections
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from .caching import LIST_CACHE_TIMEOUT, alist_cache_key, list_cache
+from .history import aemployee_history
+from .rows import asnapshots
+from .views import (
+    EmployeeListView, PayrollResultListView, PayrollRunListView, ArchivedResultListView, JobDetailView, EmployeeHistoryView,
+)
+
+# Threads running uploads, generation and archiving under ASGI; at most this many run at once.
+WORK_THREADS = getattr(settings, 'PAYROLL_WORK_THREADS', 2)
+
+_work_pool = ThreadPoolExecutor(max_workers=WORK_THREADS, thread_name_prefix='payroll-work')
+
+class Fallback(Exception):
+    """Raised by AsyncReadView.get_data for a request the DRF view has to answer."""
+
+class AsyncReadView(View):
+    """
+    Answers plain JSON GETs natively; everything else goes to `sync_view`. An instance of the DRF view is built
+    around the request so its checks, queryset, filters and serializers are reused, and only the queries are awaited.
+    """
+    sync_view = None
+    # Query parameters handled only by the DRF view.
+    fallback_params = ('cursor', 'page_size', 'format')
+
+    @classmethod
+    def sync_handler(cls):
+        if '_sync_handler' not in cls.__dict__: cls._sync_handler = cls.sync_view.as_view()
+        return cls._sync_handler
+
+    async def fallback(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_handler())(request, *args, **kwargs)
+
+    async def drf_view(self, request, args, kwargs):
+        """
+        The DRF view around this request once its `initial()` (negotiation, authentication, permissions, throttles)
+        has run, or None if the request is one for the DRF view itself.
+        """
+        view = self.sync_view(format_kwarg=None)
+        view.setup(request, *args, **kwargs)
+        view.request = Request(request, parsers=view.get_parsers(), authenticators=view.get_authenticators(), negotiator=view.get_content_negotiator())
+        if any(name in view.request.query_params for name in self.fallback_params): return None
+        try:
+            # Authentication may load the session and user, which are synchronous queries.
+            await sync_to_async(view.initial)(view.request, *args, **kwargs)
+        except APIException:
+            return None
+        return view if isinstance(view.request.accepted_renderer, JSONRenderer) else None
+
+    def render(self, view, data):
+        """(content, content type) as the DRF Response would render them."""
+        renderer, request = view.request.accepted_renderer, view.request
+        content = renderer.render(data, request.accepted_media_type, {'view': view, 'request': request, 'args': view.args, 'kwargs': view.kwargs})
+        return content, f'{renderer.media_type}; charset={renderer.charset}' if renderer.charset else renderer.media_type
+
+    def finish(self, view, response):
+        for name, value in view.default_response_headers.items(): response[name] = value
+        return response
+
+    async def get_data(self, view):
+        raise NotImplementedError
+
+    async def get(self, request, *args, **kwargs):
+        view = await self.drf_view(request, args, kwargs)
+        if view is None: return await self.fallback(request, *args, **kwargs)
+        try:
+            data = await self.get_data(view)
+        except (Fallback, APIException, ObjectDoesNotExist):
+            return await self.fallback(request, *args, **kwargs)
+        content, content_type = self.render(view, data)
+        return self.finish(view, HttpResponse(content, content_type=content_type))
+
+class AsyncListView(AsyncReadView):
+    """A CachedListMixin/LeanListMixin list: same cache entries, ETags and `?fields=`/`?summary=` handling."""
+    async def get_data(self, view):
+        fields = view.selected_fields()
+        queryset = view.filter_queryset(view.get_queryset())
+        if not getattr(view.request.accepted_renderer, 'fast_rows', False) or not hasattr(view, 'fast_values'):
+            return view.get_serializer([instance async for instance in queryset], many=True).data
+        rows = queryset.prefetch_related(None).values(*view.fast_values)
+        wanted = fields is None or 'components_snapshot' in fields
+        by_owner = await asnapshots(view.snapshot_owner, rows.values('id')) if wanted else {}
+        data = [view.fast_row(values, by_owner) async for values in rows]
+        if fields is not None: data = [{name: row[name] for name in fields} for row in data]
+        return data
+
+    def finish(self, view, response):
+        response = super().finish(view, response)
+        response['ETag'] = self.etag
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    async def get(self, request, *args, **kwargs):
+        view = await self.drf_view(request, args, kwargs)
+        if view is None: return await self.fallback(request, *args, **kwargs)
+        cache_key, self.etag = await alist_cache_key(request)
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if self.etag in if_none_match or '*' in if_none_match: return self.finish(view, HttpResponseNotModified())
+        cached = await list_cache().aget(cache_key)
+        if cached is None:
+            try:
+                data = await self.get_data(view)
+            except (Fallback, APIException, ObjectDoesNotExist):
+                return await self.fallback(request, *args, **kwargs)
+            cached = self.render(view, data)
+            await list_cache().aset(cache_key, cached, LIST_CACHE_TIMEOUT)
+        content, content_type = cached
+        return self.finish(view, HttpResponse(content, content_type=content_type))
+
+class AsyncPayrollResultListView(AsyncListView):
+    sync_view = PayrollResultListView
+
+class AsyncEmployeeListView(AsyncListView):
+    sync_view = EmployeeListView
+
+class AsyncPayrollRunListView(AsyncListView):
+    sync_view = PayrollRunListView
+
+class AsyncArchivedResultListView(AsyncListView):
+    sync_view = ArchivedResultListView
+
+class AsyncJobDetailView(AsyncReadView):
+    sync_view = JobDetailView
+
+    async def get_data(self, view):
+        return view.get_serializer(await view.get_queryset().aget(pk=view.kwargs['pk'])).data
+
+class AsyncEmployeeHistoryView(AsyncReadView):
+    sync_view = EmployeeHistoryView
+
+    async def get_data(self, view):
+        runs = view.requested_runs()
+        history = None if runs is None else await aemployee_history(view.kwargs['employee_id'], runs)
+        if history is None: raise Fallback()
+        return history
+
+def _run_on_work_pool(handler, request, *args, **kwargs):
+    # A pool thread is outside Django's request cycle, so it manages its connection as the handler would.
+    close_old_connections()
+    try:
+        response = handler(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)): response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+def close_work_connections():
+    """
+    Closes the database connections held by the work pool's threads, e.g. before dropping the database they use.
+    One task per thread, each waiting for the others, so every thread runs exactly one.
+    """
+    barrier = Barrier(WORK_THREADS)
+    def close():
+        barrier.wait()
+        connections.close_all()
+    for task in [_work_pool.submit(close) for _ in range(WORK_THREADS)]: task.result()
+
+def offloaded(view_class):
+    """
+    Async view running the DRF `view_class` on the payroll work pool when served over ASGI, so a long upload
+    occupies one of PAYROLL_WORK_THREADS threads instead of the threads async reads run their queries on.
+    Under WSGI it simply calls the view.
+    """
+    handler = view_class.as_view()
+
+    async def view(request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest): return await sync_to_async(handler)(request, *args, **kwargs)
+        return await sync_to_async(_run_on_work_pool, thread_sensitive=False, executor=_work_pool)(handler, request, *args, **kwargs)
+    return csrf_exempt(view)
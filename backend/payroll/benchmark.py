@@ -0,0 +1,192 @@
+# payroll/benchmark.py
+import asyncio
+import csv
+import random
+import statistics
+import time
+from pathlib import Path
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from .async_views import close_work_connections
+
+FIRST_NAMES = ('John', 'Mary', 'Ahmed', 'Priya', 'Wei', 'Fatima', 'Carlos', 'Anna', 'Ravi', 'Grace', 'Omar', 'Lena')
+LAST_NAMES = ('Salazar', 'Nair', 'Chen', 'Okafor', 'Smith', 'Kumar', 'Haddad', 'Rossi', 'Tanaka', 'Silva', 'Menon', 'Kowalski')
+EMPLOYEE_HEADER = ('employee_id', 'name', 'phone', 'age', 'base_salary')
+COMPONENT_HEADER = ('employee_id', 'amount', 'reason')
+
+def synthetic_employees(count, seed=0):
+    """Deterministic employee master rows for `count` employees."""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield (
+            f'E{i:06d}', f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', f'9{rng.randrange(10**9):09d}',
+            str(rng.randint(21, 60)), f'{rng.randrange(20000, 150000, 50)}.00',
+        )
+
+def synthetic_components(employee_ids, per_employee=1, seed=0, reason='Benchmark'):
+    """Deterministic component rows: `per_employee` amounts for every employee id."""
+    rng = random.Random(seed)
+    for employee_id in employee_ids:
+        for _ in range(per_employee):
+            yield employee_id, f'{rng.randrange(100, 500000) / 100:.2f}', reason
+
+def write_sheet(path, header, rows):
+    """Writes rows as CSV or XLSX depending on the file suffix."""
+    path = Path(path)
+    if path.suffix == '.csv':
+        with open(path, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(header)
+            writer.writerows(rows)
+    else:
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(header)
+        for row in rows: sheet.append(row)
+        workbook.save(path)
+    return path
+
+def write_dataset(directory, employees, file_format='csv', seed=0, files_per_type=2, components_per_employee=1):
+    """
+    Writes one employee master plus `files_per_type` incentive and deduction sheets under `directory`.
+    Each component file covers every employee. Returns {'employees': path, 'incentive': [...], 'deduction': [...]}.
+    """
+    directory = Path(directory)
+    employee_ids = [f'E{i:06d}' for i in range(employees)]
+    dataset = {'employees': write_sheet(directory / f'employees_{employees}.{file_format}', EMPLOYEE_HEADER, synthetic_employees(employees, seed))}
+    for offset, component_type in enumerate(('incentive', 'deduction')):
+        dataset[component_type] = [
+            write_sheet(
+                directory / f'{component_type}_{employees}_{n}.{file_format}', COMPONENT_HEADER,
+                synthetic_components(employee_ids, components_per_employee, seed=seed + 100 * offset + n, reason=f'{component_type} {n}'),
+            )
+            for n in range(files_per_type)
+        ]
+    return dataset
+
+def measure(client, method, path, **kwargs):
+    """One request through the test client: status, wall time, query count and SQL time."""
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = getattr(client, method)(path, **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+    body = b''.join(response.streaming_content) if response.streaming else response.content
+    return {
+        'status': response.status_code, 'ms': round(elapsed, 2), 'queries': len(queries),
+        'sql_ms': round(sum(float(query['time']) for query in queries.captured_queries) * 1000, 2), 'bytes': len(body),
+        'response': response,
+    }
+
+def measure_repeated(client, path, repeat):
+    """
+    GETs `path` `repeat` times. The first request's metrics are the uncached cost; the median of the
+    repeats (served from the list response cache) is reported as `repeat_ms`.
+    """
+    runs = [measure(client, 'get', path) for _ in range(max(repeat, 1))]
+    step = {key: value for key, value in runs[0].items() if key != 'response'}
+    if len(runs) > 1: step.update(repeat_ms=round(statistics.median(run['ms'] for run in runs[1:]), 2), repeat_queries=runs[-1]['queries'])
+    return step
+
+def _upload(client, path, files, data):
+    handles = [open(file, 'rb') for file in files]
+    try:
+        return measure(client, 'post', path, data={**data, 'files': handles})
+    finally:
+        for handle in handles: handle.close()
+
+def _summarize(step):
+    step = dict(step)
+    response = step.pop('response')
+    if response.get('Content-Type', '').startswith('application/json'):
+        step['result'] = {key: value for key, value in response.json().items() if isinstance(value, (int, float, str, dict)) and key != 'message'}
+    return step
+
+def run_scenario(dataset, repeat=3, page_size=100):
+    """
+    Runs upload -> generate -> list -> archive -> history against the current (empty) database
+    and returns {step name: metrics}.
+    """
+    client, steps = Client(), {}
+    steps['upload_employee'] = _summarize(_upload(client, '/api/upload/employee/', [dataset['employees']], {}))
+    for component_type in ('incentive', 'deduction'):
+        steps[f'upload_{component_type}'] = _summarize(_upload(client, '/api/upload/component/', dataset[component_type], {'type': component_type}))
+    steps['generate'] = _summarize(measure(client, 'post', '/api/payroll/generate/'))
+    for name, path in (
+        ('list_employees', '/api/employees/'),
+        ('list_results', '/api/payroll/results/'),
+        ('list_results_summary', '/api/payroll/results/?summary=1'),
+        ('list_results_page', f'/api/payroll/results/?page_size={page_size}'),
+        ('search_results', '/api/payroll/results/?search=sal'),
+    ):
+        steps[name] = measure_repeated(client, path, repeat)
+    etag = client.get('/api/payroll/results/').get('ETag', '')
+    steps['list_results_not_modified'] = _summarize(measure(client, 'get', '/api/payroll/results/', HTTP_IF_NONE_MATCH=etag))
+    archive = measure(client, 'post', '/api/payroll/archive/')
+    run_id = archive['response'].json().get('run_id')
+    steps['archive'] = _summarize(archive)
+    for name, path in (
+        ('list_history', '/api/payroll/history/'),
+        ('list_archived', f'/api/payroll/history/{run_id}/'),
+        ('list_archived_page', f'/api/payroll/history/{run_id}/?page_size={page_size}'),
+    ):
+        steps[name] = measure_repeated(client, path, repeat)
+    return steps
+
+def _latency(samples, errors):
+    ordered = sorted(samples)
+    if not ordered: return {'requests': 0, 'errors': errors}
+    def percentile(fraction): return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+    return {'requests': len(ordered), 'errors': errors, 'p50_ms': percentile(0.5), 'p95_ms': percentile(0.95), 'max_ms': round(ordered[-1], 2)}
+
+async def _poll(client, paths, reader, done):
+    """GETs `paths` in turn until done(requests made). Each URL is unique, so no read is a response-cache hit."""
+    latencies, errors = [], 0
+    while not done(len(latencies)):
+        path = paths[len(latencies) % len(paths)]
+        started = time.perf_counter()
+        response = await client.get(f"{path}{'&' if '?' in path else '?'}poll={reader}-{len(latencies)}")
+        latencies.append((time.perf_counter() - started) * 1000)
+        errors += response.status_code != 200
+    return latencies, errors
+
+async def _load_test(paths, upload_files, readers, requests):
+    client = AsyncClient()
+    async def phase(done):
+        polls = await asyncio.gather(*(_poll(client, paths, reader, done) for reader in range(readers)))
+        return _latency([ms for latencies, _ in polls for ms in latencies], sum(errors for _, errors in polls))
+    idle = await phase(lambda made: made >= requests)
+    handles = [open(file, 'rb') for file in upload_files]
+    try:
+        started = time.perf_counter()
+        upload = asyncio.ensure_future(client.post('/api/upload/component/', {'type': 'deduction', 'files': handles}))
+        busy = await phase(lambda made: made > 0 and upload.done())
+        response = await upload
+    finally:
+        for handle in handles: handle.close()
+    return {
+        'readers': readers, 'idle': idle, 'during_upload': busy,
+        'upload': {'status': response.status_code, 'ms': round((time.perf_counter() - started) * 1000, 2)},
+    }
+
+def run_load_test(dataset, readers=8, requests=25):
+    """
+    Concurrent-read load test through the ASGI handler (django.test.AsyncClient): `readers` pollers hit the
+    dashboard's read endpoints, first alone (`requests` each) and then for as long as the deduction sheets take
+    to upload. Read latency should stay flat across the two phases. Expects run_scenario() to have run first.
+    """
+    client = Client()
+    job_id = client.post('/api/payroll/generate/?async=1').json()['job_id']
+    run_id = client.get('/api/payroll/history/').json()[0]['id']
+    employee_id = client.get('/api/employees/?fields=employee_id').json()[0]['employee_id']
+    paths = (
+        f'/api/jobs/{job_id}/', '/api/payroll/history/', f'/api/payroll/history/{run_id}/?page_size=50',
+        f'/api/employees/{employee_id}/history/', '/api/payroll/results/?status=approved',
+    )
+    try:
+        return async_to_sync(_load_test)(paths, dataset['deduction'], readers, requests)
+    finally:
+        # The upload ran on a work pool thread, which keeps its connection open for reuse.
+        close_work_connections()
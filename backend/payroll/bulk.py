@@ -0,0 +1,93 @@
+# payroll/bulk.py
+from decimal import Decimal
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models
+
+# PostgreSQL bulk loads use COPY ... FROM STDIN (needs psycopg 3); otherwise rows go through one prepared executemany INSERT.
+BULK_COPY = getattr(settings, 'PAYROLL_BULK_COPY', True)
+
+def copy_enabled():
+    if not BULK_COPY or connection.vendor != 'postgresql': return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+def _columns(model, fields):
+    return [connection.ops.quote_name(model._meta.get_field(name).column) for name in fields]
+
+def _preparer(field, db):
+    """
+    The field's get_db_prep_save for one column, memoized per call since columns repeat values (timestamps,
+    amounts). A str bound for a text column is passed through as is. DecimalFields are checked against max_digits
+    first: the raw statements skip model validation, and an out-of-range value would be stored but fail to load back.
+    """
+    if isinstance(field.target_field if field.is_relation else field, (models.CharField, models.TextField)):
+        return lambda value: value if value is None or type(value) is str else field.get_db_prep_save(value, db)
+    if isinstance(field, models.DecimalField):
+        limit, adapt = Decimal(10) ** (field.max_digits - field.decimal_places), db.ops.adapt_decimalfield_value
+        def prepare(value):
+            if value is not None and not isinstance(value, Decimal): value = field.to_python(value)
+            if value is not None and not (value.is_finite() and -limit < value < limit):
+                raise ValueError(f'{field.model.__name__}.{field.name}: {value} does not fit max_digits={field.max_digits}, decimal_places={field.decimal_places}')
+            return adapt(value, field.max_digits, field.decimal_places)
+    else:
+        def prepare(value): return field.get_db_prep_save(value, db)
+    memo = {}
+    def memoized(value):
+        if value not in memo: memo[value] = prepare(value)
+        return memo[value]
+    return memoized
+
+def _prepared(model, fields, rows):
+    """Rows with each value passed through its field's _preparer, one column at a time."""
+    db = connections[DEFAULT_DB_ALIAS]
+    columns = zip(fields, zip(*rows))
+    return list(zip(*(map(_preparer(model._meta.get_field(name), db), column) for name, column in columns)))
+
+def _copy(cursor, table, columns, rows):
+    count = 0
+    with cursor.copy(f'COPY {table} ({", ".join(columns)}) FROM STDIN') as copy:
+        for row in rows:
+            copy.write_row(row)
+            count += 1
+    return count
+
+def _insert(cursor, table, columns, rows, suffix=''):
+    rows = list(rows)
+    if rows: cursor.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))}){suffix}', rows)
+    return len(rows)
+
+def load_rows(model, fields, rows):
+    """
+    Bulk-inserts tuples ordered like `fields`, skipping model instances, defaults and signals. Values are Python
+    values prepared by their field's get_db_prep_save; a Decimal its column cannot hold raises ValueError.
+    Returns the number of rows written.
+    """
+    table, columns, rows = connection.ops.quote_name(model._meta.db_table), _columns(model, fields), _prepared(model, fields, rows)
+    with connection.cursor() as cursor:
+        if copy_enabled(): return _copy(cursor, table, columns, rows)
+        return _insert(cursor, table, columns, rows)
+
+def upsert_rows(model, fields, rows, unique_field, update_fields):
+    """
+    load_rows that updates `update_fields` of rows whose unique_field already exists (INSERT ... ON CONFLICT DO UPDATE).
+    On PostgreSQL the rows are COPYed into a temporary staging table and merged with one statement.
+    """
+    quote = connection.ops.quote_name
+    table, columns, rows = quote(model._meta.db_table), _columns(model, fields), _prepared(model, fields, rows)
+    updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in _columns(model, update_fields))
+    conflict = f' ON CONFLICT ({_columns(model, [unique_field])[0]}) DO UPDATE SET {updates}'
+    with connection.cursor() as cursor:
+        if not copy_enabled(): return _insert(cursor, table, columns, rows, conflict)
+        staging = quote(f'{model._meta.db_table}_staging')
+        # Created inside the caller's transaction, so a failure part-way rolls the staging table back with it.
+        cursor.execute(f'CREATE TEMPORARY TABLE {staging} (LIKE {table} INCLUDING DEFAULTS)')
+        count = _copy(cursor, staging, columns, rows)
+        cursor.execute(f'INSERT INTO {table} ({", ".join(columns)}) SELECT {", ".join(columns)} FROM {staging}{conflict}')
+        cursor.execute(f'DROP TABLE {staging}')
+        return count
+
+def analyze(*models):
+    """Refreshes PostgreSQL planner statistics after a bulk change; autovacuum would otherwise lag behind the next query."""
+    if connection.vendor != 'postgresql': return
+    with connection.cursor() as cursor:
+        for model in models: cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
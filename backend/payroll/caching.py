@@ -0,0 +1,63 @@
+# payroll/caching.py
+import hashlib
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from .models import Employee, Component, PayrollResult, PayrollRun, ArchivedPayrollResult, PayrollLineItem
+
+# Must be shared by the web server and run_payroll_worker (file-based, Redis, ...) for worker writes to invalidate.
+CACHE_ALIAS = getattr(settings, 'PAYROLL_CACHE_ALIAS', 'default')
+LIST_CACHE_TIMEOUT = getattr(settings, 'PAYROLL_LIST_CACHE_TIMEOUT', 300)
+VERSION_KEY = 'payroll:data-version'
+
+def list_cache():
+    return caches[CACHE_ALIAS]
+
+def data_version():
+    """Opaque token that changes whenever payroll data is written."""
+    version = list_cache().get(VERSION_KEY)
+    if version is None:
+        list_cache().add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = list_cache().get(VERSION_KEY)
+    return version
+
+async def adata_version():
+    """data_version() through the cache's async API."""
+    version = await list_cache().aget(VERSION_KEY)
+    if version is None:
+        await list_cache().aadd(VERSION_KEY, uuid.uuid4().hex, None)
+        version = await list_cache().aget(VERSION_KEY)
+    return version
+
+def _new_version():
+    list_cache().set(VERSION_KEY, uuid.uuid4().hex, None)
+
+def bump_data_version():
+    """
+    Invalidates every cached list response. Bumped right away and again on commit, so a read that ran
+    while the write's transaction was still open cannot keep serving pre-commit data.
+    """
+    _new_version()
+    transaction.on_commit(_new_version)
+
+def _list_cache_key(version, request):
+    source = f"{version}\n{request.get_full_path()}\n{request.META.get('HTTP_ACCEPT', '')}"
+    digest = hashlib.sha256(source.encode()).hexdigest()
+    return f'payroll:list:{digest}', f'"{digest[:32]}"'
+
+def list_cache_key(request):
+    """(cache key, ETag) of a GET for the current data version, URL and Accept header."""
+    return _list_cache_key(data_version(), request)
+
+async def alist_cache_key(request):
+    return _list_cache_key(await adata_version(), request)
+
+def _bump_on_write(sender, **kwargs):
+    bump_data_version()
+
+# Single-row writes (approve/reject, manual components, admin edits). Bulk paths call bump_data_version() themselves.
+for model in (Employee, Component, PayrollResult, PayrollRun, ArchivedPayrollResult, PayrollLineItem):
+    post_save.connect(_bump_on_write, sender=model, dispatch_uid=f'payroll-cache-save-{model.__name__}')
+    post_delete.connect(_bump_on_write, sender=model, dispatch_uid=f'payroll-cache-delete-{model.__name__}')
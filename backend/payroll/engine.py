@@ -0,0 +1,285 @@
+# payroll/engine.py
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+from . import bulk
+from .caching import bump_data_version
+from .metrics import count_rows
+from .models import Employee, Component, PayrollResult, PayrollRun, ArchivedPayrollResult, PayrollLineItem, EmployeeYearTotals
+
+# Rows per bulk_create / bulk_update statement when writing payroll results.
+GENERATE_BATCH_SIZE = getattr(settings, 'PAYROLL_GENERATE_BATCH_SIZE', 1000)
+# Rows removed per DELETE statement (and transaction) when a payroll run is deleted.
+DELETE_CHUNK_SIZE = getattr(settings, 'PAYROLL_DELETE_CHUNK_SIZE', 5000)
+
+class NothingToArchive(Exception):
+    """Raised when an archive is requested while there are no current payroll results."""
+
+@contextmanager
+def _timed(timings, phase):
+    started = time.perf_counter()
+    try: yield
+    finally: timings[phase] = round((time.perf_counter() - started) * 1000, 2)
+
+def component_totals(components):
+    """One grouped query: per-employee incentive/deduction totals plus the employee's base salary."""
+    rows = (
+        components.values('employee_id', 'employee__base_salary')
+        .annotate(
+            incentives=Sum('amount', filter=Q(type='incentive'), default=Decimal('0')),
+            deductions=Sum('amount', filter=Q(type='deduction'), default=Decimal('0')),
+        )
+        .order_by()
+    )
+    return {row['employee_id']: row for row in rows}
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+def _column(model, field_name):
+    return connection.ops.quote_name(model._meta.get_field(field_name).column)
+
+def write_line_items(token):
+    """
+    Copies the components claimed with `token` into PayrollLineItems of their employees' current results
+    with one INSERT ... SELECT, so no rows pass through Python. Returns the number of line items written.
+    """
+    copied = ('employee_id', 'type', 'amount', 'reason', 'source_file')
+    item, component, result = PayrollLineItem, Component, PayrollResult
+    columns = ', '.join([_column(item, 'result'), _column(item, 'attachment'), _column(item, 'created_at')] + [_column(item, name) for name in copied])
+    values = ', '.join(['r.' + _column(result, 'id'), f"NULLIF(c.{_column(component, 'attachment')}, '')", '%s'] + ['c.' + _column(component, name) for name in copied])
+    result_id, result_employee = _column(result, 'id'), _column(result, 'employee')
+    statement = (
+        f'INSERT INTO {_table(item)} ({columns}) SELECT {values} FROM {_table(component)} c '
+        # Grouped once rather than a correlated MAX per component, which PostgreSQL evaluates per joined row pair.
+        f'INNER JOIN (SELECT {result_employee}, MAX({result_id}) AS {result_id} FROM {_table(result)} GROUP BY {result_employee}) r '
+        f'ON r.{result_employee} = c.{_column(component, "employee")} '
+        f'WHERE c.{_column(component, "claimed_by")} = %s ORDER BY c.{_column(component, "employee")}, c.{_column(component, "id")}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(statement, [
+            connection.ops.adapt_datetimefield_value(timezone.now()),
+            component._meta.get_field('claimed_by').get_db_prep_value(token, connection),
+        ])
+        return cursor.rowcount
+
+def claim_components(token):
+    """
+    Marks the components that exist right now (id up to the current maximum, not claimed by another run)
+    as consumed by this generation. Returns (watermark, claimed count).
+    """
+    watermark = Component.objects.aggregate(watermark=Max('id'))['watermark']
+    if watermark is None: return None, 0
+    return watermark, Component.objects.filter(id__lte=watermark, claimed_by__isnull=True).update(claimed_by=token)
+
+def generate_payroll(batch_size=GENERATE_BATCH_SIZE):
+    """
+    Folds the pending components into the current PayrollResults with a fixed number of queries
+    (plus one per write batch) and deletes them. Only the components claimed at the start are touched,
+    so uploads running concurrently are left for the next generation. Returns counts and per-phase timings in ms.
+    """
+    timings, started = {}, time.perf_counter()
+    with transaction.atomic():
+        with _timed(timings, 'claim'):
+            token = uuid.uuid4()
+            watermark, _ = claim_components(token)
+            # Otherwise the planner still sees every claimed_by as NULL and expects one claimed row in the joins below.
+            bulk.analyze(Component)
+        components = Component.objects.filter(claimed_by=token)
+        pending_employees = components.values('employee_id')
+        with _timed(timings, 'aggregate'):
+            totals = component_totals(components)
+        with _timed(timings, 'load_results'):
+            existing = {result.employee_id: result for result in PayrollResult.objects.filter(employee_id__in=pending_employees).order_by('id')}
+        to_create, to_update = [], []
+        for employee_id, row in totals.items():
+            result = existing.get(employee_id)
+            if result is None:
+                result = PayrollResult(employee_id=employee_id, total_incentives=Decimal('0'), total_deductions=Decimal('0'))
+                to_create.append(result)
+            else:
+                to_update.append(result)
+            result.total_incentives += row['incentives']
+            result.total_deductions += row['deductions']
+            result.final_salary = (row['employee__base_salary'] or Decimal('0.00')) + result.total_incentives - result.total_deductions
+        with _timed(timings, 'write'):
+            PayrollResult.objects.bulk_create(to_create, batch_size=batch_size)
+            PayrollResult.objects.bulk_update(to_update, ['total_incentives', 'total_deductions', 'final_salary'], batch_size=batch_size)
+        with _timed(timings, 'line_items'):
+            write_line_items(token)
+        with _timed(timings, 'clear'):
+            # Raw DELETE: the ORM would load every component to send the per-row post_delete cache signal.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {_table(Component)} WHERE {_column(Component, "claimed_by")} = %s',
+                    [Component._meta.get_field('claimed_by').get_db_prep_value(token, connection)],
+                )
+                consumed = cursor.rowcount
+    count_rows('payroll_results', len(totals))
+    bump_data_version()
+    return {
+        'employees': len(totals), 'components': consumed, 'watermark': watermark,
+        'created': len(to_create), 'updated': len(to_update),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2), 'timings': timings,
+    }
+
+def run_rollups(run_id):
+    """Headcount, status counts and money totals of one archived run, in a single aggregate query."""
+    return ArchivedPayrollResult.objects.filter(run_id=run_id).aggregate(
+        headcount=Count('id'),
+        approved_count=Count('id', filter=Q(status='approved')),
+        rejected_count=Count('id', filter=Q(status='rejected')),
+        pending_count=Count('id', filter=Q(status='pending')),
+        total_base_salary=Sum('base_salary', default=Decimal('0')),
+        total_incentives=Sum('total_incentives', default=Decimal('0')),
+        total_deductions=Sum('total_deductions', default=Decimal('0')),
+        total_final_salary=Sum('final_salary', default=Decimal('0')),
+    )
+
+def _archive_statement():
+    """INSERT ... SELECT copying current results (id <= %s) joined to their employee into run %s."""
+    copied = [
+        ('employee_id', Employee, 'employee_id'), ('employee_name', Employee, 'name'), ('base_salary', Employee, 'base_salary'),
+        ('total_incentives', PayrollResult, 'total_incentives'), ('total_deductions', PayrollResult, 'total_deductions'),
+        ('final_salary', PayrollResult, 'final_salary'), ('status', PayrollResult, 'status'),
+        ('rejection_reason', PayrollResult, 'rejection_reason'),
+    ]
+    alias = {Employee: 'e', PayrollResult: 'r'}
+    columns = ', '.join([_column(ArchivedPayrollResult, 'run')] + [_column(ArchivedPayrollResult, name) for name, _, _ in copied])
+    values = ', '.join(['%s'] + [f'{alias[model]}.{_column(model, field)}' for _, model, field in copied])
+    return (
+        f'INSERT INTO {_table(ArchivedPayrollResult)} ({columns}) '
+        f'SELECT {values} FROM {_table(PayrollResult)} r '
+        f'INNER JOIN {_table(Employee)} e ON e.{_column(Employee, "employee_id")} = r.{_column(PayrollResult, "employee")} '
+        f'WHERE r.{_column(PayrollResult, "id")} <= %s ORDER BY r.{_column(PayrollResult, "id")}'
+    )
+
+def _repoint_statement():
+    """
+    UPDATE ... FROM moving the line items of results up to a watermark onto a run and that run's archived row
+    of their employee, as one join. Params: run id, run id, watermark.
+    """
+    item, archived = PayrollLineItem, ArchivedPayrollResult
+    return (
+        f'UPDATE {_table(item)} SET {_column(item, "run")} = %s, {_column(item, "result")} = NULL, '
+        f'{_column(item, "archived_result")} = a.{_column(archived, "id")} FROM {_table(archived)} a '
+        f'WHERE a.{_column(archived, "run")} = %s AND a.{_column(archived, "employee_id")} = {_table(item)}.{_column(item, "employee_id")} '
+        f'AND {_table(item)}.{_column(item, "result")} <= %s'
+    )
+
+_YEAR_TOTALS = ('total_incentives', 'total_deductions', 'total_final_salary')
+_ARCHIVED_AMOUNTS = ('total_incentives', 'total_deductions', 'final_salary')
+
+def _add_year_totals_statement():
+    """
+    INSERT ... SELECT ... ON CONFLICT adding each employee's results of run %s (params: year, run id) to their
+    EmployeeYearTotals row, creating it on the employee's first run of the year.
+    """
+    totals, archived = EmployeeYearTotals, ArchivedPayrollResult
+    employee = _column(archived, 'employee_id')
+    counters = [_column(totals, 'run_count')] + [_column(totals, name) for name in _YEAR_TOTALS]
+    columns = ', '.join([_column(totals, 'employee_id'), _column(totals, 'year')] + counters)
+    sums = ', '.join(f'SUM(a.{_column(archived, name)})' for name in _ARCHIVED_AMOUNTS)
+    updates = ', '.join(f'{column} = {_table(totals)}.{column} + EXCLUDED.{column}' for column in counters)
+    return (
+        f'INSERT INTO {_table(totals)} ({columns}) SELECT a.{employee}, %s, 1, {sums} FROM {_table(archived)} a '
+        f'WHERE a.{_column(archived, "run")} = %s GROUP BY a.{employee} '
+        f'ON CONFLICT ({_column(totals, "employee_id")}, {_column(totals, "year")}) DO UPDATE SET {updates}'
+    )
+
+def _subtract_year_totals_statement():
+    """UPDATE ... FROM taking each employee's results of a run back out of their year totals. Params: run id, year."""
+    totals, archived = EmployeeYearTotals, ArchivedPayrollResult
+    employee = _column(archived, 'employee_id')
+    sums = ', '.join(f'SUM({_column(archived, source)}) AS {_column(totals, name)}' for source, name in zip(_ARCHIVED_AMOUNTS, _YEAR_TOTALS))
+    updates = ', '.join(
+        [f'{_column(totals, "run_count")} = {_table(totals)}.{_column(totals, "run_count")} - 1']
+        + [f'{_column(totals, name)} = {_table(totals)}.{_column(totals, name)} - d.{_column(totals, name)}' for name in _YEAR_TOTALS]
+    )
+    return (
+        f'UPDATE {_table(totals)} SET {updates} FROM (SELECT {employee}, {sums} FROM {_table(archived)} '
+        f'WHERE {_column(archived, "run")} = %s GROUP BY {employee}) d '
+        f'WHERE {_table(totals)}.{_column(totals, "employee_id")} = d.{employee} AND {_table(totals)}.{_column(totals, "year")} = %s'
+    )
+
+def _totals_year(run_timestamp):
+    return timezone.localtime(run_timestamp).year
+
+def archive_payroll(run_name=None):
+    """
+    Copies the current PayrollResults into a new PayrollRun with a single database-side INSERT ... SELECT,
+    re-points their line items, writes the run rollups, adds the run to the employees' year totals and clears
+    the dashboard. Only results that existed
+    when the archive started (id up to the current maximum) are moved.
+    """
+    started = time.perf_counter()
+    with transaction.atomic():
+        watermark = PayrollResult.objects.aggregate(watermark=Max('id'))['watermark']
+        if watermark is None:
+            raise NothingToArchive('No current payroll results to archive.')
+        new_run = PayrollRun.objects.create(run_name=run_name)
+        with connection.cursor() as cursor:
+            cursor.execute(_archive_statement(), [new_run.pk, watermark])
+            archived = cursor.rowcount
+        bulk.analyze(ArchivedPayrollResult, PayrollLineItem)
+        with connection.cursor() as cursor:
+            cursor.execute(_repoint_statement(), [new_run.pk, new_run.pk, watermark])
+            line_items = cursor.rowcount
+        with connection.cursor() as cursor:
+            cursor.execute(_add_year_totals_statement(), [_totals_year(new_run.run_timestamp), new_run.pk])
+        PayrollRun.objects.filter(pk=new_run.pk).update(in_employee_totals=True, **run_rollups(new_run.pk))
+        # Line items were detached above, so a plain DELETE is safe and avoids the ORM cascade collector.
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {_table(PayrollResult)} WHERE {_column(PayrollResult, "id")} <= %s', [watermark])
+    count_rows('archived_results', archived)
+    bump_data_version()
+    return {
+        'message': 'Successfully archived payroll run. The dashboard is now clear.',
+        'run_id': new_run.id, 'archived': archived, 'line_items': line_items,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+
+def _delete_in_chunks(model, fk_field, value, chunk_size):
+    table, pk = _table(model), _column(model, 'id')
+    statement = (
+        f'DELETE FROM {table} WHERE {pk} IN '
+        f'(SELECT {pk} FROM {table} WHERE {_column(model, fk_field)} = %s LIMIT %s)'
+    )
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(statement, [value, chunk_size])
+            if cursor.rowcount <= 0: return deleted
+            deleted += cursor.rowcount
+
+def delete_payroll_run(run_id, chunk_size=DELETE_CHUNK_SIZE):
+    """
+    Deletes an archived run with raw, bounded DELETE statements (each in its own short transaction)
+    instead of letting the ORM collect every archived row for the cascade. The run row goes last.
+    The run is first taken out of the employees' year totals, exactly once even if a deletion is retried.
+    """
+    started = time.perf_counter()
+    with transaction.atomic():
+        run_timestamp = PayrollRun.objects.select_for_update().filter(pk=run_id, in_employee_totals=True).values_list('run_timestamp', flat=True).first()
+        if run_timestamp is not None:
+            year = _totals_year(run_timestamp)
+            with connection.cursor() as cursor:
+                cursor.execute(_subtract_year_totals_statement(), [run_id, year])
+            EmployeeYearTotals.objects.filter(year=year, run_count=0).delete()
+            PayrollRun.objects.filter(pk=run_id).update(in_employee_totals=False)
+    try:
+        line_items = _delete_in_chunks(PayrollLineItem, 'run', run_id, chunk_size)
+        archived = _delete_in_chunks(ArchivedPayrollResult, 'run', run_id, chunk_size)
+        PayrollRun.objects.filter(pk=run_id).delete()
+    finally:
+        # Chunks commit one by one, so a failure part-way still leaves cached lists out of date.
+        bump_data_version()
+    return {
+        'message': 'Payroll run deleted.', 'run_id': run_id, 'archived_results': archived, 'line_items': line_items,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,67 @@
+# payroll/exports.py
+import csv
+import io
+import tempfile
+from datetime import datetime
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from .streaming import file_response, stream
+
+# Rows fetched per database round trip (and per streamed CSV block).
+EXPORT_CHUNK_SIZE = getattr(settings, 'PAYROLL_EXPORT_CHUNK_SIZE', 2000)
+
+# (header, field lookup) pairs for each export.
+RESULT_COLUMNS = [
+    ('employee_id', 'employee__employee_id'), ('employee_name', 'employee__name'), ('base_salary', 'employee__base_salary'),
+    ('total_incentives', 'total_incentives'), ('total_deductions', 'total_deductions'), ('final_salary', 'final_salary'),
+    ('status', 'status'), ('rejection_reason', 'rejection_reason'), ('created_at', 'created_at'),
+]
+ARCHIVED_RESULT_COLUMNS = [
+    ('employee_id', 'employee_id'), ('employee_name', 'employee_name'), ('base_salary', 'base_salary'),
+    ('total_incentives', 'total_incentives'), ('total_deductions', 'total_deductions'), ('final_salary', 'final_salary'),
+    ('status', 'status'), ('rejection_reason', 'rejection_reason'),
+]
+
+def _rows(queryset, columns):
+    return queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+def _csv_blocks(queryset, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in columns])
+    for count, row in enumerate(_rows(queryset, columns), start=1):
+        writer.writerow(row)
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def csv_response(request, queryset, columns, filename):
+    """Streams the queryset as CSV; rows are pulled from the database chunk by chunk as the client reads."""
+    return StreamingHttpResponse(
+        stream(request, _csv_blocks(queryset, columns)), content_type='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'},
+    )
+
+def _excel_value(value):
+    # Excel has no notion of time zones.
+    return value.replace(tzinfo=None) if isinstance(value, datetime) and value.tzinfo else value
+
+def xlsx_response(request, queryset, columns, filename):
+    """Writes the queryset with a write-only workbook (rows go straight to disk) and streams the file back."""
+    from openpyxl import Workbook  # Loaded on first use, not at start-up.
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Payroll')
+    sheet.append([header for header, _ in columns])
+    for row in _rows(queryset, columns):
+        sheet.append([_excel_value(value) for value in row])
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return file_response(
+        request, output, as_attachment=True, filename=f'{filename}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+EXPORTERS = {'csv': csv_response, 'xlsx': xlsx_response}
@@ -0,0 +1,131 @@
+# payroll/history.py
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from .models import Employee, ArchivedPayrollResult, EmployeeYearTotals
+
+# Archived runs returned by the employee history by default, and the most a request may ask for with `?runs=`.
+HISTORY_RUNS = getattr(settings, 'PAYROLL_HISTORY_RUNS', 12)
+HISTORY_MAX_RUNS = getattr(settings, 'PAYROLL_HISTORY_MAX_RUNS', 120)
+
+HISTORY_RUN_VALUES = (
+    'run_id', 'run__run_name', 'employee_name', 'run__run_timestamp', 'base_salary', 'total_incentives', 'total_deductions',
+    'final_salary', 'status', 'rejection_reason',
+)
+YEAR_TOTAL_VALUES = ('year', 'run_count', 'total_incentives', 'total_deductions', 'total_final_salary')
+# Amounts of an archived result; history and diff render them as 2-decimal strings.
+MONEY_FIELDS = ('base_salary', 'total_incentives', 'total_deductions', 'final_salary')
+
+# Amounts compared by the run diff; `?ordering=` sorts by the absolute delta of one of them (or by employee_id).
+DIFF_FIELDS = MONEY_FIELDS
+DIFF_ORDERINGS = DIFF_FIELDS + ('employee_id',)
+DIFF_CHANGES = ('added', 'removed', 'changed')
+CENT = Decimal('0.01')
+
+def _money(value):
+    """
+    An amount as the serializers' DecimalFields render it: a 2-decimal string, never a JSON float. SQLite hands
+    back floats for decimal arithmetic; PostgreSQL already returns Decimal.
+    """
+    return None if value is None else format(Decimal(str(value)).quantize(CENT), 'f')
+
+def _history_queries(employee_id, runs):
+    return (
+        ArchivedPayrollResult.objects.filter(employee_id=employee_id).order_by('-run_id').values(*HISTORY_RUN_VALUES)[:runs],
+        EmployeeYearTotals.objects.filter(employee_id=employee_id).order_by('-year').values(*YEAR_TOTAL_VALUES),
+        Employee.objects.filter(pk=employee_id).values('name'),
+    )
+
+def _history(employee_id, rows, years, employee):
+    if employee is None and not rows and not years: return None
+    name = employee['name'] if employee else rows[0]['employee_name'] if rows else None
+    history = [{
+        'run_id': row['run_id'], 'run_name': row['run__run_name'], 'run_timestamp': row['run__run_timestamp'],
+        **{field: _money(row[field]) for field in MONEY_FIELDS},
+        'status': row['status'], 'rejection_reason': row['rejection_reason'],
+    } for row in rows]
+    return {
+        'employee_id': employee_id, 'name': name,
+        'recent': {
+            'runs': len(history),
+            'total_incentives': _money(sum((row['total_incentives'] for row in rows), Decimal('0'))),
+            'total_deductions': _money(sum((row['total_deductions'] for row in rows), Decimal('0'))),
+            'total_final_salary': _money(sum((row['final_salary'] for row in rows), Decimal('0'))),
+        },
+        'years': [{**year, **{field: _money(year[field]) for field in YEAR_TOTAL_VALUES[2:]}} for year in years],
+        'runs': history,
+    }
+
+def employee_history(employee_id, runs=HISTORY_RUNS):
+    """
+    One employee's last `runs` archived results (newest run first) with their totals, plus the employee's
+    cumulative per-year totals read from EmployeeYearTotals. Both are index lookups on employee_id, so the cost
+    does not grow with the number of runs or employees. None when the employee has no record at all.
+    """
+    rows, years, employee = _history_queries(employee_id, runs)
+    return _history(employee_id, list(rows), list(years), employee.first())
+
+async def aemployee_history(employee_id, runs=HISTORY_RUNS):
+    """employee_history() through the async ORM."""
+    rows, years, employee = _history_queries(employee_id, runs)
+    return _history(employee_id, [row async for row in rows], [row async for row in years], await employee.afirst())
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+def _column(model, field_name):
+    return connection.ops.quote_name(model._meta.get_field(field_name).column)
+
+def _diff_statement():
+    """
+    Employees whose archived result differs between a base run and another run, one row each with both sides
+    and the deltas (other - base). Results of the base run LEFT JOINed to the other run, UNION ALL the other run's
+    employees missing from the base; every lookup goes through the (run, employee_id) index.
+    Params: other run, base run, other run, base run.
+    """
+    archived, table = ArchivedPayrollResult, _table(ArchivedPayrollResult)
+    employee, pk, run, name = (_column(archived, field) for field in ('employee_id', 'id', 'run', 'employee_name'))
+    amounts = [_column(archived, field) for field in DIFF_FIELDS]
+    changed = ' OR '.join(f'a.{column} <> b.{column}' for column in amounts)
+    base_side = ', '.join(
+        f'a.{column} AS base_{field}, b.{column} AS other_{field}, COALESCE(b.{column}, 0) - a.{column} AS delta_{field}'
+        for field, column in zip(DIFF_FIELDS, amounts)
+    )
+    added_side = ', '.join(f'NULL AS base_{field}, b.{column} AS other_{field}, b.{column} AS delta_{field}' for field, column in zip(DIFF_FIELDS, amounts))
+    return (
+        f"SELECT a.{employee} AS employee_id, COALESCE(b.{name}, a.{name}) AS employee_name, "
+        f"CASE WHEN b.{pk} IS NULL THEN 'removed' ELSE 'changed' END AS change_type, {base_side} "
+        f'FROM {table} a LEFT JOIN {table} b ON b.{run} = %s AND b.{employee} = a.{employee} '
+        f'WHERE a.{run} = %s AND (b.{pk} IS NULL OR {changed}) '
+        f"UNION ALL SELECT b.{employee}, b.{name}, 'added', {added_side} FROM {table} b "
+        f'WHERE b.{run} = %s AND NOT EXISTS (SELECT 1 FROM {table} a WHERE a.{run} = %s AND a.{employee} = b.{employee})'
+    )
+
+def run_diff(base_run_id, other_run_id, ordering='final_salary', change=None, limit=100, offset=0):
+    """
+    Compares two archived runs inside the database: employees added to, removed from or changed in `other_run_id`
+    relative to `base_run_id`. Returns the per-change summary (counts and summed deltas) and one page of rows sorted
+    by the largest absolute delta of `ordering` first (or by employee id), optionally only one kind of `change`.
+    """
+    diff = f'({_diff_statement()}) d'
+    params = [other_run_id, base_run_id, other_run_id, base_run_id]
+    where, where_params = (' WHERE d.change_type = %s', [change]) if change else ('', [])
+    order = 'd.employee_id' if ordering == 'employee_id' else f'ABS(d.delta_{ordering}) DESC, d.employee_id'
+    columns = ['employee_id', 'employee_name', 'change_type'] + [f'{side}_{field}' for field in DIFF_FIELDS for side in ('base', 'other', 'delta')]
+    deltas = ', '.join(f'SUM(d.delta_{field})' for field in DIFF_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT d.change_type, COUNT(*), {deltas} FROM {diff} GROUP BY d.change_type', params)
+        summary = {kind: {'count': 0, **{field: _money(0) for field in DIFF_FIELDS}} for kind in DIFF_CHANGES}
+        for kind, count, *sums in cursor.fetchall():
+            summary[kind] = {'count': count, **{field: _money(total) for field, total in zip(DIFF_FIELDS, sums)}}
+        cursor.execute(
+            f'SELECT {", ".join("d." + column for column in columns)} FROM {diff}{where} ORDER BY {order} LIMIT %s OFFSET %s',
+            params + where_params + [limit, offset],
+        )
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    results = [{
+        'employee_id': row['employee_id'], 'employee_name': row['employee_name'], 'change': row['change_type'],
+        **{field: {'base': _money(row[f'base_{field}']), 'other': _money(row[f'other_{field}']), 'delta': _money(row[f'delta_{field}'])} for field in DIFF_FIELDS},
+    } for row in rows]
+    count = summary[change]['count'] if change else sum(kind['count'] for kind in summary.values())
+    return {'base_run': base_run_id, 'other_run': other_run_id, 'count': count, 'summary': summary, 'results': results}
@@ -0,0 +1,409 @@
+# payroll/ingest.py
+import csv
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+from . import bulk, parse_cache
+from .caching import bump_data_version
+from .metrics import count_rows
+from .models import Employee, Component
+
+# Rows written per bulk upsert statement group (and per transaction).
+UPSERT_BATCH_SIZE = getattr(settings, 'PAYROLL_UPSERT_BATCH_SIZE', 1000)
+# Spreadsheet rows parsed, validated and flushed at a time by the streaming component ingest.
+INGEST_CHUNK_SIZE = getattr(settings, 'PAYROLL_INGEST_CHUNK_SIZE', 5000)
+# Worker processes used to parse multi-file component uploads concurrently (1 disables the pool).
+PARSE_WORKERS = getattr(settings, 'PAYROLL_PARSE_WORKERS', os.cpu_count() or 1)
+# Rejected rows listed per file in upload responses (the 'skipped' count is always exact).
+REJECT_REPORT_LIMIT = getattr(settings, 'PAYROLL_REJECT_REPORT_LIMIT', 1000)
+
+# What is left of an amount cell after stripping currency symbols, separators and spaces.
+AMOUNT_PATTERN = r'-?(?:\d+\.?\d*|\.\d+)'
+CENT = Decimal('0.01')
+# Largest magnitude the amount columns (max_digits=10, decimal_places=2) hold; anything bigger cannot be read back.
+_amount_field = Component._meta.get_field('amount')
+MAX_AMOUNT = Decimal(10) ** (_amount_field.max_digits - _amount_field.decimal_places) - CENT
+_AMOUNT = re.compile(AMOUNT_PATTERN)
+_NOT_AMOUNT = re.compile(r'[^\d.-]')
+# pandas' default missing-value markers, so the stdlib CSV path reads cells exactly like read_csv(dtype=str).
+NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+class MissingColumnsError(ValueError):
+    """The sheet is readable but lacks a column the upload requires."""
+
+# pandas and openpyxl are imported where a spreadsheet is actually parsed, keeping them out of process start-up.
+
+def _read_csv(file_path):
+    """
+    Stdlib reader for .csv sheets: yields the header, then a (line, cells) pair for every non-blank row, with the
+    cells padded to the header's width, pandas' missing-value markers turned into None and `line` the physical line
+    the row starts on. Rows wider than the header are rejected rather than having their leading cells silently read
+    as an index, as pandas does.
+    """
+    try:
+        with open(file_path, newline='', encoding='utf-8-sig') as handle:
+            reader = csv.reader(handle)
+            header = next(reader, None)
+            if header is None: raise ValueError('No columns to parse from file')
+            yield header
+            width, ended = len(header), reader.line_num
+            for row in reader:
+                # line_num counts physical lines, so blank lines and quoted line breaks are accounted for.
+                line, ended = ended + 1, reader.line_num
+                if not row: continue
+                if len(row) > width: raise ValueError(f'Expected {width} fields in line {line}, saw {len(row)}')
+                yield line, [None if value in NA_VALUES else value for value in row] + [None] * (width - len(row))
+    except (ValueError, csv.Error, OSError) as e: raise ValueError(f"Could not read file: {e}")
+
+def _read_xlsx(file_path):
+    """openpyxl twin of _read_csv for .xlsx/.xlsm sheets, streamed in read-only mode; empty rows are skipped."""
+    try:
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+    except Exception as e: raise ValueError(f"Could not read file: {e}")
+    try:
+        # A read-only sheet yields rows missing from the file as empty ones, so counting from 1 gives the row number.
+        rows = enumerate(workbook.worksheets[0].iter_rows(values_only=True), start=1)
+        _, header = next(rows, (None, None))
+        if header is None: return
+        columns = [str(c) if c is not None else f'Unnamed: {i}' for i, c in enumerate(header)]
+        yield columns
+        width = len(columns)
+        for line, row in rows:
+            if all(v is None for v in row): continue
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            yield line, [None if v is None else str(v) for v in row]
+    except Exception as e: raise ValueError(f"Could not read file: {e}")
+    finally:
+        workbook.close()
+
+def _read_excel(file_path):
+    """pandas.read_excel twin of _read_csv for the other Excel formats; the header is line 1."""
+    import pandas as pd
+    try: df = pd.read_excel(file_path, dtype=str)
+    except Exception as e: raise ValueError(f"Could not read file: {e}")
+    yield [str(c) for c in df.columns]
+    for line, row in enumerate(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None), start=2):
+        if any(v is not None for v in row): yield line, list(row)
+
+def _read_sheet(file_path):
+    if file_path.endswith('.csv'): return _read_csv(file_path)
+    if file_path.endswith(('.xlsx', '.xlsm')): return _read_xlsx(file_path)
+    return _read_excel(file_path)
+
+def iter_spreadsheet_chunks(file_path, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Yields a sheet as string DataFrames of at most chunk_size rows without loading the whole file. Each frame is
+    indexed by the sheet line numbers of its rows; a sheet without rows still yields one empty frame.
+    """
+    import pandas as pd
+    records = _read_sheet(file_path)
+    columns, lines, batch, yielded = next(records, []), [], [], False
+    for line, row in records:
+        lines.append(line)
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield pd.DataFrame(batch, columns=columns, index=lines, dtype=object)
+            lines, batch, yielded = [], [], True
+    if batch or not yielded: yield pd.DataFrame(batch, columns=columns, index=lines, dtype=object)
+
+def read_spreadsheet(file_path):
+    """A whole sheet as one string DataFrame indexed by sheet line number."""
+    import pandas as pd
+    return pd.concat(list(iter_spreadsheet_chunks(file_path)))
+
+def _fixed_point(cleaned_value):
+    """The 2-decimal Decimal of a cleaned amount, or None when it is not a finite number that fits MAX_AMOUNT."""
+    try: amount = Decimal(cleaned_value).quantize(CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation: return None
+    return amount if amount.is_finite() and abs(amount) <= MAX_AMOUNT else None
+
+def parse_amount_series(series):
+    """
+    Column-wise amount parser. Strips everything but digits, '.' and '-' with one vectorized pass, validates the
+    result against AMOUNT_PATTERN and converts each distinct valid value to a 2-decimal fixed-point Decimal once;
+    values beyond MAX_AMOUNT are invalid. Returns (amounts with None for invalid cells, boolean validity mask).
+    """
+    cleaned = series.astype('string').str.replace(r'[^\d.-]', '', regex=True)
+    valid = cleaned.str.fullmatch(AMOUNT_PATTERN).fillna(False).astype(bool)
+    lookup = {value: _fixed_point(value) for value in cleaned[valid].unique()}
+    amounts = cleaned.map(lookup).astype(object)
+    valid &= amounts.notna()
+    return amounts.where(valid, None), valid
+
+def parse_amount(value, memo):
+    """Single-cell twin of parse_amount_series; `memo` maps cleaned strings to their Decimal (or None)."""
+    if value is None: return None
+    cleaned = _NOT_AMOUNT.sub('', value)
+    if cleaned not in memo: memo[cleaned] = _fixed_point(cleaned) if _AMOUNT.fullmatch(cleaned) else None
+    return memo[cleaned]
+
+def reject(line, employee_id, reason):
+    return {'line': line, 'employee_id': employee_id, 'reason': reason}
+
+def prepare_employee_frame(df):
+    """
+    Normalizes an employee master sheet to one row per employee_id (the last occurrence wins). Returns
+    (frame, rejects) where rejects lists the sheet rows without an employee_id or with an unreadable base_salary;
+    an empty base_salary stays 0.00.
+    """
+    import pandas as pd
+    employee_ids = df['employee_id'].astype('string').str.strip()
+    has_id = (employee_ids.notna() & (employee_ids != '')).astype(bool)
+    frame = pd.DataFrame({'employee_id': employee_ids})
+    frame['name'] = df['name'].astype('string').str.strip().fillna('') if 'name' in df.columns else ''
+    if 'base_salary' in df.columns:
+        salaries, valid = parse_amount_series(df['base_salary'])
+        frame['base_salary'] = salaries.where(valid, Decimal('0.00'))
+        bad_salary = df['base_salary'].notna() & ~valid
+    else:
+        frame['base_salary'] = Decimal('0.00')
+        bad_salary = pd.Series(False, index=df.index)
+    rejected = ~has_id | bad_salary
+    rejects = [
+        reject(line, employee_id, 'invalid base_salary') if has else reject(line, None, 'missing employee_id')
+        for line, employee_id, has in zip(df.index[rejected].tolist()[:REJECT_REPORT_LIMIT], employee_ids[rejected], has_id[rejected])
+    ]
+    return frame[~rejected].drop_duplicates('employee_id', keep='last'), rejects
+
+def read_employee_csv(file_path):
+    """
+    pandas-free prepare_employee_frame for .csv masters. Returns (employees as (employee_id, name, base_salary)
+    tuples, one per employee_id with the last occurrence winning, rejects, rows read).
+    """
+    records = _read_csv(file_path)
+    header = next(records)
+    if 'employee_id' not in header: raise MissingColumnsError("Master file must have 'employee_id' column.")
+    id_at, name_at = header.index('employee_id'), header.index('name') if 'name' in header else None
+    salary_at = header.index('base_salary') if 'base_salary' in header else None
+    employees, rejects, memo, rows_read = {}, [], {}, 0
+    for line, row in records:
+        rows_read += 1
+        employee_id = (row[id_at] or '').strip()
+        if not employee_id:
+            if len(rejects) < REJECT_REPORT_LIMIT: rejects.append(reject(line, None, 'missing employee_id'))
+            continue
+        salary = parse_amount(row[salary_at], memo) if salary_at is not None else None
+        if salary is None and salary_at is not None and row[salary_at] is not None:
+            if len(rejects) < REJECT_REPORT_LIMIT: rejects.append(reject(line, employee_id, 'invalid base_salary'))
+            continue
+        name = (row[name_at] or '').strip() if name_at is not None else ''
+        employees.pop(employee_id, None)
+        employees[employee_id] = (employee_id, name, salary if salary is not None else Decimal('0.00'))
+    return list(employees.values()), rejects, rows_read
+
+def upsert_employees(employees, batch_size=UPSERT_BATCH_SIZE, progress=None):
+    """Writes (employee_id, name, base_salary) tuples with one bulk upsert per batch. Returns (inserted, updated)."""
+    inserted = updated = 0
+    for start in range(0, len(employees), batch_size):
+        batch = employees[start:start + batch_size]
+        with transaction.atomic():
+            existing = Employee.objects.filter(employee_id__in=[row[0] for row in batch]).count()
+            bulk.upsert_rows(Employee, ('employee_id', 'name', 'base_salary'), batch, 'employee_id', ('name', 'base_salary'))
+        updated += existing
+        inserted += len(batch) - existing
+        if progress: progress(inserted + updated)
+    return inserted, updated
+
+def normalize_component_chunk(df):
+    """
+    Cleans one chunk column-wise into a (line, employee_id, amount, reason) tuple per row, `line` being the frame's
+    index; unusable values become None.
+    """
+    if not {'employee_id', 'amount'}.issubset(df.columns):
+        raise MissingColumnsError("Sheet must have 'employee_id' and 'amount' columns.")
+    employee_ids = df['employee_id'].astype('string').str.strip()
+    employee_ids = employee_ids.astype(object).where(employee_ids.notna() & (employee_ids != ''), None)
+    amounts, _ = parse_amount_series(df['amount'])
+    reasons = df['reason'].astype(object).where(df['reason'].notna(), None) if 'reason' in df.columns else [None] * len(df)
+    return list(zip(df.index.tolist(), employee_ids, amounts, reasons))
+
+def _iter_csv_component_chunks(file_path, chunk_size):
+    """pandas-free normalize_component_chunk over a .csv sheet, in chunks of at most chunk_size rows."""
+    records = _read_csv(file_path)
+    header = next(records)
+    if not {'employee_id', 'amount'}.issubset(header):
+        raise MissingColumnsError("Sheet must have 'employee_id' and 'amount' columns.")
+    id_at, amount_at = header.index('employee_id'), header.index('amount')
+    reason_at = header.index('reason') if 'reason' in header else None
+    batch, memo = [], {}
+    for line, row in records:
+        batch.append((
+            line, (row[id_at] or '').strip() or None, parse_amount(row[amount_at], memo),
+            row[reason_at] if reason_at is not None else None,
+        ))
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+def iter_component_rows(file_path, chunk_size=INGEST_CHUNK_SIZE):
+    """Yields a component sheet as lists of normalized (line, employee_id, amount, reason) rows; .csv never touches pandas."""
+    if file_path.endswith('.csv'):
+        yield from _iter_csv_component_chunks(file_path, chunk_size)
+        return
+    for chunk in iter_spreadsheet_chunks(file_path, chunk_size):
+        yield normalize_component_chunk(chunk)
+
+# Written by the bulk loader in this order; attachment is '' like an unset FileField saved through the ORM.
+COMPONENT_FIELDS = ('employee_id', 'type', 'amount', 'reason', 'source_file', 'source_hash', 'attachment', 'created_at', 'updated_at')
+
+def _write_components(rows, component_type, valid_employee_ids, source_file, source_hash, rejects):
+    valid = []
+    now = timezone.now()
+    for line, employee_id, amount, reason in rows:
+        if employee_id is None: problem = 'missing employee_id'
+        elif amount is None: problem = 'invalid amount'
+        elif employee_id not in valid_employee_ids: problem = 'unknown employee_id'
+        else:
+            valid.append((employee_id, component_type, amount, reason, source_file, source_hash, '', now, now))
+            continue
+        if len(rejects) < REJECT_REPORT_LIMIT: rejects.append(reject(line, employee_id, problem))
+    return bulk.load_rows(Component, COMPONENT_FIELDS, valid)
+
+def ingest_component_rows(chunks, component_type, valid_employee_ids, source_file, source_hash=None):
+    """
+    Writes chunks of already-normalized rows (read back from the parse cache) in one transaction.
+    Returns (rows read, created, rejects).
+    """
+    rows_read = created = 0
+    rejects = []
+    with transaction.atomic():
+        for rows in chunks:
+            created += _write_components(rows, component_type, valid_employee_ids, source_file, source_hash, rejects)
+            rows_read += len(rows)
+    return rows_read, created, rejects
+
+def ingest_component_file(file_path, component_type, valid_employee_ids, source_file, source_hash=None, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Parses one sheet into its parse cache entry outside any transaction, then streams the cached rows into
+    Components in a single per-file transaction, one bulk insert per chunk. The write lock (BEGIN IMMEDIATE on
+    SQLite) is thus only held while rows are inserted, not while the sheet is parsed. Returns (rows read, created, rejects).
+    """
+    fingerprint = source_hash or parse_cache.file_fingerprint(file_path)
+    parse_component_file(file_path, fingerprint, chunk_size)
+    chunks = parse_cache.load(fingerprint, chunk_size)
+    # Only a concurrent upload evicting the fresh entry gets here; the sheet is then parsed inside the transaction.
+    if chunks is None: chunks = iter_component_rows(file_path, chunk_size)
+    return ingest_component_rows(chunks, component_type, valid_employee_ids, source_file, source_hash)
+
+def parse_component_file(file_path, fingerprint, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Process-pool task: streams a sheet's normalized rows chunk by chunk into its parse cache entry, so neither the
+    worker nor the parent ever holds the whole sheet. Returns the number of rows parsed.
+    """
+    rows_read = 0
+    with parse_cache.writer(fingerprint) as entry:
+        for rows in iter_component_rows(file_path, chunk_size):
+            entry.write(rows)
+            rows_read += len(rows)
+    return rows_read
+
+def _outcome(future):
+    try: return future.result()
+    except Exception as e: return e
+
+def parse_files_in_parallel(file_paths, fingerprints, workers=PARSE_WORKERS):
+    """
+    Parses sheets concurrently into their parse cache entries and returns each file's row count (or the exception
+    it raised) in input order. Workers are spawned, not forked: the server process runs threads (the ASGI loop, the
+    work pool, database drivers), and a forked child can inherit a lock another thread held and hang on it.
+    """
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(file_paths)), mp_context=multiprocessing.get_context('spawn'),
+        initializer=parse_cache.init_worker, initargs=(str(settings.MEDIA_ROOT),),
+    ) as pool:
+        futures = [pool.submit(parse_component_file, path, fingerprint) for path, fingerprint in zip(file_paths, fingerprints)]
+        return [_outcome(future) for future in futures]
+
+def process_employee_sheet(filename, progress=None):
+    """Upserts the employee master stored under `filename` in MEDIA_ROOT and returns the upload summary."""
+    path = FileSystemStorage().path(filename)
+    if path.endswith('.csv'):
+        employees, rejects, rows_read = read_employee_csv(path)
+    else:
+        df = read_spreadsheet(path)
+        if 'employee_id' not in df.columns: raise MissingColumnsError("Master file must have 'employee_id' column.")
+        frame, rejects = prepare_employee_frame(df)
+        employees, rows_read = list(frame.itertuples(index=False, name=None)), len(df)
+    try:
+        inserted, updated = upsert_employees(employees, progress=progress)
+    finally:
+        # Every batch commits on its own, so cached lists are invalidated even if a later batch fails.
+        bump_data_version()
+    bulk.analyze(Employee)
+    count_rows('employees', inserted + updated)
+    return {
+        'message': 'Employee master sheet processed.',
+        'inserted': inserted, 'updated': updated, 'skipped': rows_read - len(employees), 'rejects': rejects,
+    }
+
+def process_component_files(filenames, component_type, progress=None, workers=PARSE_WORKERS):
+    """
+    Ingests stored incentive/deduction sheets in upload order, one transaction per file that only writes rows.
+    Each sheet is fingerprinted: a sheet already uploaded since the last generation is flagged as a duplicate
+    and skipped, and a sheet parsed before is streamed from the parse cache. When there are several sheets left and
+    workers > 1 they are parsed in a process pool straight into parse cache entries, which are then streamed in the
+    same way; otherwise each sheet is parsed into its entry in-process first.
+    Every file gets an entry in the returned report, and failures and duplicates are listed as warnings.
+    """
+    fs = FileSystemStorage()
+    paths = [fs.path(filename) for filename in filenames]
+    fingerprints = [parse_cache.file_fingerprint(path) for path in paths]
+    valid_employee_ids = set(Employee.objects.values_list('employee_id', flat=True))
+    seen = set(Component.objects.filter(source_hash__in=fingerprints).values_list('source_hash', flat=True).distinct())
+    duplicates, to_parse = set(), []
+    for index, fingerprint in enumerate(fingerprints):
+        if fingerprint in seen:
+            duplicates.add(index)
+            continue
+        seen.add(fingerprint)
+        if not parse_cache.contains(fingerprint): to_parse.append(index)
+    parsed = {}
+    if workers > 1 and len(to_parse) > 1:
+        outcomes = parse_files_in_parallel([paths[index] for index in to_parse], [fingerprints[index] for index in to_parse], workers)
+        parsed = dict(zip(to_parse, outcomes))
+
+    def ingest(index):
+        filename, fingerprint = filenames[index], fingerprints[index]
+        outcome = parsed.pop(index, None)
+        if isinstance(outcome, Exception): raise outcome
+        chunks = parse_cache.load(fingerprint, INGEST_CHUNK_SIZE)
+        if chunks is not None:
+            # A corrupt entry rolls its transaction back and has been deleted, so the sheet is simply parsed again.
+            try: return ingest_component_rows(chunks, component_type, valid_employee_ids, filename, fingerprint), index not in to_parse
+            except parse_cache.CorruptEntry: pass
+        return ingest_component_file(paths[index], component_type, valid_employee_ids, filename, fingerprint), False
+
+    files, warnings, created = [], [], 0
+    for index, filename in enumerate(filenames):
+        if index in duplicates:
+            files.append({'file': filename, 'status': 'duplicate'})
+            warnings.append(f'{filename}: identical file already uploaded since the last payroll generation; skipped.')
+            continue
+        try:
+            (rows_read, file_created, rejects), cached = ingest(index)
+        except Exception as e:
+            files.append({'file': filename, 'status': 'failed', 'error': str(e)})
+            warnings.append(f'{filename}: {e}')
+            continue
+        created += file_created
+        files.append({
+            'file': filename, 'status': 'ok', 'cached': cached,
+            'rows': rows_read, 'created': file_created, 'skipped': rows_read - file_created, 'rejects': rejects,
+        })
+        if rows_read > file_created: warnings.append(f'{filename}: {rows_read - file_created} row(s) rejected.')
+        if progress: progress(created)
+    if created: bulk.analyze(Component)
+    count_rows('components', created)
+    bump_data_version()
+    return {'message': f'{created} {component_type} records processed.', 'created': created, 'files': files, 'warnings': warnings}
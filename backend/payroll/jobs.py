@@ -0,0 +1,71 @@
+# payroll/jobs.py
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .engine import generate_payroll, archive_payroll
+from .ingest import process_employee_sheet, process_component_files
+from .models import Job
+
+def _upload_employee(payload, progress):
+    result = process_employee_sheet(payload['filename'], progress=progress)
+    return result, result['inserted'] + result['updated']
+
+def _upload_component(payload, progress):
+    result = process_component_files(payload['filenames'], payload['type'], progress=progress)
+    return result, result['created']
+
+def _generate(payload, progress):
+    result = generate_payroll()
+    return result, result['components']
+
+def _archive(payload, progress):
+    result = archive_payroll(payload.get('run_name'))
+    return result, result['archived']
+
+# Seconds a running job may go without a heartbeat (claim or progress report) before it counts as abandoned by a
+# worker that was killed. Must exceed the longest stretch a job runs without reporting progress, e.g. a generation.
+JOB_TIMEOUT = getattr(settings, 'PAYROLL_JOB_TIMEOUT', 3600)
+
+# Job.kind -> handler(payload, progress) returning (JSON result, rows processed).
+HANDLERS = {
+    'upload_employee': _upload_employee,
+    'upload_component': _upload_component,
+    'generate': _generate,
+    'archive': _archive,
+}
+
+def enqueue(kind, **payload):
+    return Job.objects.create(kind=kind, payload=payload)
+
+def claim_next_job():
+    """Atomically moves the oldest queued job to 'running'; safe with several workers polling at once."""
+    while True:
+        job = Job.objects.filter(state='queued').order_by('id').first()
+        if job is None: return None
+        now = timezone.now()
+        if Job.objects.filter(pk=job.pk, state='queued').update(state='running', started_at=now, heartbeat_at=now):
+            job.refresh_from_db()
+            return job
+
+def fail_stale_jobs(timeout=JOB_TIMEOUT):
+    """
+    Marks 'running' jobs without a heartbeat for `timeout` seconds as failed: their worker died mid-job (killed,
+    OOM, lost host), so nothing else would ever finish them. They are not re-queued, since the work may have
+    committed in part. Returns the number of jobs failed.
+    """
+    now = timezone.now()
+    return Job.objects.filter(state='running', heartbeat_at__lt=now - timedelta(seconds=timeout)).update(
+        state='failed', error=f'Worker stopped responding; no heartbeat for {timeout} s.', finished_at=now,
+    )
+
+def run_job(job):
+    def progress(rows):
+        Job.objects.filter(pk=job.pk).update(rows_processed=rows, heartbeat_at=timezone.now())
+    try:
+        result, rows = HANDLERS[job.kind](job.payload, progress)
+    except Exception as e:
+        Job.objects.filter(pk=job.pk).update(state='failed', error=str(e), finished_at=timezone.now())
+    else:
+        Job.objects.filter(pk=job.pk).update(state='succeeded', result=result, rows_processed=rows, finished_at=timezone.now())
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,84 @@
+# payroll/management/commands/run_payroll_benchmark.py
+import json
+import platform
+import sys
+import tempfile
+from pathlib import Path
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from payroll.benchmark import write_dataset, run_scenario, run_load_test
+from payroll.caching import CACHE_ALIAS, bump_data_version
+
+class Command(BaseCommand):
+    help = (
+        'Times the upload, generate, archive and list endpoints on synthetic payroll data and writes the results as JSON. '
+        'Runs against a throwaway test database; the configured database is not touched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, nargs='+', default=[1000], help='Employee counts to benchmark, e.g. 1000 10000 100000.')
+        parser.add_argument('--formats', nargs='+', choices=['csv', 'xlsx'], default=['csv'], help='Sheet formats to upload.')
+        parser.add_argument('--files-per-type', type=int, default=2, help='Incentive and deduction sheets uploaded per run.')
+        parser.add_argument('--components-per-employee', type=int, default=1, help='Rows per employee in each component sheet.')
+        parser.add_argument('--repeat', type=int, default=3, help='Times each list endpoint is requested; repeats after the first are served from the response cache.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data.')
+        parser.add_argument('--load-test', action='store_true', help='After each scenario, measure concurrent read latency through the ASGI handler while sheets upload.')
+        parser.add_argument('--readers', type=int, default=8, help='Concurrent readers in the load test.')
+        parser.add_argument('--label', default='', help='Free-form label stored with the results, e.g. a version or commit.')
+        parser.add_argument('--output', help='JSON file to write; printed to stdout when omitted.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory(prefix='payroll_benchmark_') as workdir:
+            workdir = Path(workdir)
+            (workdir / 'media').mkdir()
+            if connection.vendor == 'sqlite':
+                # A file rather than the default in-memory test database, to match how the app runs.
+                connection.settings_dict['TEST']['NAME'] = str(workdir / 'benchmark.sqlite3')
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                local_cache = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'payroll-benchmark'}
+                with override_settings(MEDIA_ROOT=str(workdir / 'media'), CACHES={'default': local_cache, CACHE_ALIAS: local_cache}):
+                    scenarios = self.run_scenarios(workdir, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+        report = {
+            'label': options['label'], 'created_at': timezone.now().isoformat(), 'database': connection.vendor,
+            'python': platform.python_version(), 'django': django.get_version(),
+            'options': {key: options[key] for key in ('employees', 'formats', 'files_per_type', 'components_per_employee', 'repeat', 'seed', 'load_test', 'readers')},
+            'scenarios': scenarios,
+        }
+        payload = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(payload)
+            self.stdout.write(self.style.SUCCESS(f"Benchmark results written to {options['output']}."))
+        else:
+            self.stdout.write(payload)
+
+    def run_scenarios(self, workdir, options):
+        scenarios = []
+        for employees in options['employees']:
+            for file_format in options['formats']:
+                call_command('flush', interactive=False, verbosity=0)
+                bump_data_version()
+                data_dir = workdir / f'{employees}_{file_format}'
+                data_dir.mkdir()
+                dataset = write_dataset(
+                    data_dir, employees, file_format, seed=options['seed'],
+                    files_per_type=options['files_per_type'], components_per_employee=options['components_per_employee'],
+                )
+                steps = run_scenario(dataset, repeat=options['repeat'])
+                scenarios.append({'employees': employees, 'format': file_format, 'steps': steps})
+                for name, step in steps.items():
+                    sys.stderr.write(f"{employees:>7} {file_format:<4} {name:<26} {step['status']} {step['ms']:>10.2f} ms {step['queries']:>6} queries\n")
+                if options['load_test']:
+                    load = scenarios[-1]['load_test'] = run_load_test(dataset, readers=options['readers'])
+                    for name in ('idle', 'during_upload'):
+                        phase = load[name]
+                        sys.stderr.write(f"{employees:>7} {file_format:<4} reads {name:<20} p50 {phase['p50_ms']:>8.2f} ms p95 {phase['p95_ms']:>8.2f} ms {phase['requests']:>5} requests\n")
+        return scenarios
@@ -0,0 +1,27 @@
+# payroll/management/commands/run_payroll_worker.py
+import time
+from django.db import close_old_connections
+from django.core.management.base import BaseCommand
+from payroll.jobs import claim_next_job, fail_stale_jobs, run_job
+
+class Command(BaseCommand):
+    help = 'Runs queued payroll jobs (uploads, generation, archiving) from the database. No broker required.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit as soon as the queue is empty.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Payroll worker started.')
+        while True:
+            close_old_connections()
+            # Checked on start-up and on every poll, so jobs left running by a killed worker do not stay running forever.
+            stale = fail_stale_jobs()
+            if stale: self.stdout.write(f'Failed {stale} job(s) abandoned by a stopped worker.')
+            job = claim_next_job()
+            if job is None:
+                if options['once']: break
+                time.sleep(options['poll_interval'])
+                continue
+            job = run_job(job)
+            self.stdout.write(f'{job} finished in {job.elapsed_ms} ms, {job.rows_processed} rows.')
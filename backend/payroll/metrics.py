@@ -0,0 +1,84 @@
+# payroll/metrics.py
+import threading
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+ROW_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+class Histogram:
+    """Cumulative Prometheus-style histogram for one label set."""
+    def __init__(self, buckets):
+        self.buckets, self.counts, self.sum, self.count = buckets, [0] * len(buckets), 0.0, 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound: self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+class Registry:
+    """In-process metrics: histograms and counters keyed by name and labels, rendered in Prometheus text format."""
+    def __init__(self):
+        self.lock, self.histograms, self.counters, self.help = threading.Lock(), {}, {}, {}
+
+    def observe(self, name, value, buckets, help_text, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, ('histogram', help_text))
+            self.histograms.setdefault(name, {}).setdefault(key, Histogram(buckets)).observe(value)
+
+    def increment(self, name, amount, help_text, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, ('counter', help_text))
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def reset(self):
+        with self.lock: self.histograms, self.counters, self.help = {}, {}, {}
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name in sorted(self.help):
+                kind, help_text = self.help[name]
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                if kind == 'counter':
+                    for key, value in sorted(self.counters[name].items()):
+                        lines.append(f'{name}{_labels(key)} {_number(value)}')
+                    continue
+                for key, histogram in sorted(self.histograms[name].items()):
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{_labels(key + (("le", _number(bound)),))} {count}')
+                    lines.append(f'{name}_bucket{_labels(key + (("le", "+Inf"),))} {histogram.count}')
+                    lines.append(f'{name}_sum{_labels(key)} {_number(histogram.sum)}')
+                    lines.append(f'{name}_count{_labels(key)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _labels(key):
+    if not key: return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in key)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + '}'
+
+REGISTRY = Registry()
+# Rows counted by the request currently being handled; set by MetricsMiddleware.
+request_rows = ContextVar('payroll_request_rows', default=None)
+
+def count_rows(kind, rows):
+    """Records rows ingested/generated/archived, globally by kind and against the current request if any."""
+    if not rows: return
+    REGISTRY.increment('payroll_rows_total', rows, 'Rows written by payroll operations.', kind=kind)
+    tally = request_rows.get()
+    if tally is not None: tally.append(rows)
+
+def observe_request(endpoint, method, status, seconds, queries, sql_seconds, rows):
+    labels = {'endpoint': endpoint, 'method': method}
+    REGISTRY.increment('payroll_http_requests_total', 1, 'HTTP requests handled.', status=str(status), **labels)
+    REGISTRY.observe('payroll_http_request_duration_seconds', seconds, LATENCY_BUCKETS, 'Request latency.', **labels)
+    REGISTRY.observe('payroll_http_request_queries', queries, QUERY_BUCKETS, 'SQL queries per request.', **labels)
+    REGISTRY.observe('payroll_http_request_sql_seconds', sql_seconds, LATENCY_BUCKETS, 'Time spent in SQL per request.', **labels)
+    if rows: REGISTRY.observe('payroll_http_request_rows', rows, ROW_BUCKETS, 'Rows ingested or generated per request.', **labels)
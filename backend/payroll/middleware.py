@@ -0,0 +1,120 @@
+# payroll/middleware.py
+import cProfile
+import logging
+import re
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from .metrics import request_rows, observe_request
+
+logger = logging.getLogger('payroll.metrics')
+
+# None (off), 'sql' (dump the queries of slow requests) or 'cprofile' (also profile every request and dump slow ones).
+PROFILE_MODE = getattr(settings, 'PAYROLL_PROFILE', None)
+PROFILE_THRESHOLD_MS = getattr(settings, 'PAYROLL_PROFILE_THRESHOLD_MS', 1000)
+PROFILE_DIR = Path(getattr(settings, 'PAYROLL_PROFILE_DIR', Path(settings.BASE_DIR) / 'profiles'))
+# QueryRecorder of the request currently being handled; follows the request into async ORM threads.
+request_queries = ContextVar('payroll_request_queries', default=None)
+
+class QueryRecorder:
+    """connection.execute_wrapper that counts queries and their time; keeps the SQL when `trace` is set."""
+    def __init__(self, trace=False):
+        self.count, self.seconds, self.trace = 0, 0.0, [] if trace else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if self.trace is not None: self.trace.append((elapsed, sql))
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper of every connection: passes the query through the current request's QueryRecorder, if any."""
+    recorder = request_queries.get()
+    if recorder is None: return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    """
+    connection_created receiver. Installed on each connection rather than around each request, so the queries
+    that async views run on other threads' connections are counted too.
+    """
+    if record_queries not in connection.execute_wrappers: connection.execute_wrappers.append(record_queries)
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL query count and time, and rows written for every request into the in-process
+    histograms served at /api/metrics/. With PAYROLL_PROFILE set, requests slower than
+    PAYROLL_PROFILE_THRESHOLD_MS leave a slow-query trace (and a cProfile dump) in PAYROLL_PROFILE_DIR.
+    Works in both sync and async middleware chains.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode: markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode: return self.__acall__(request)
+        install_query_recorder(connection=connection)
+        recorder, rows = QueryRecorder(trace=PROFILE_MODE is not None), []
+        profiler = _start_profiler() if PROFILE_MODE == 'cprofile' else None
+        tokens = request_queries.set(recorder), request_rows.set(rows)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_queries.reset(tokens[0])
+            request_rows.reset(tokens[1])
+            if profiler: profiler.disable()
+        self.observe(request, response, elapsed, recorder, rows, profiler)
+        return response
+
+    async def __acall__(self, request):
+        # An async request hops between threads, which cProfile cannot follow; only the SQL trace applies.
+        recorder, rows = QueryRecorder(trace=PROFILE_MODE is not None), []
+        tokens = request_queries.set(recorder), request_rows.set(rows)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_queries.reset(tokens[0])
+            request_rows.reset(tokens[1])
+        self.observe(request, response, elapsed, recorder, rows, None)
+        return response
+
+    def observe(self, request, response, elapsed, recorder, rows, profiler):
+        match = getattr(request, 'resolver_match', None)
+        endpoint = '/' + match.route if match and match.route else 'unmatched'
+        observe_request(endpoint, request.method, response.status_code, elapsed, recorder.count, recorder.seconds, sum(rows))
+        if PROFILE_MODE and elapsed * 1000 >= PROFILE_THRESHOLD_MS:
+            _dump_slow_request(request, endpoint, elapsed, recorder, profiler)
+        return response
+
+def _start_profiler():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # Another profiler is already active in this thread.
+        return None
+    return profiler
+
+def _dump_slow_request(request, endpoint, elapsed, recorder, profiler):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', endpoint).strip('_') or 'root'
+    base = PROFILE_DIR / f"{timezone.now():%Y%m%dT%H%M%S%f}_{request.method}_{slug}"
+    lines = [f'{request.method} {request.get_full_path()} {elapsed * 1000:.1f} ms, {recorder.count} queries, {recorder.seconds * 1000:.1f} ms SQL']
+    lines += [f'{seconds * 1000:10.2f} ms  {sql}' for seconds, sql in sorted(recorder.trace, key=lambda entry: entry[0], reverse=True)]
+    Path(f'{base}.sql.txt').write_text('\n'.join(lines) + '\n')
+    if profiler: profiler.dump_stats(f'{base}.prof')
+    logger.warning('Slow request %s %s took %.1f ms; trace written to %s.*', request.method, request.get_full_path(), elapsed * 1000, base)
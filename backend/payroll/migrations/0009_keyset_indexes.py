@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0008_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedpayrollresult',
+            index=models.Index(fields=['run', 'id'], name='payroll_arc_run_id_978bcd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payrollresult',
+            index=models.Index(fields=['-created_at', '-id'], name='payroll_pay_created_e5e4d3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payrollrun',
+            index=models.Index(fields=['-run_timestamp', '-id'], name='payroll_pay_run_tim_5a1a66_idx'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:25
+
+from decimal import Decimal
+from urllib.parse import unquote
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.encoding import filepath_to_uri
+
+SNAPSHOT_KEYS = (('incentives', 'incentive'), ('deductions', 'deduction'))
+
+
+def _attachment_name(url):
+    if not url: return None
+    return unquote(url[len(settings.MEDIA_URL):] if url.startswith(settings.MEDIA_URL) else url)
+
+
+def snapshots_to_line_items(apps, schema_editor):
+    """Moves every existing components_snapshot entry into its own PayrollLineItem row."""
+    PayrollResult = apps.get_model('payroll', 'PayrollResult')
+    ArchivedPayrollResult = apps.get_model('payroll', 'ArchivedPayrollResult')
+    PayrollLineItem = apps.get_model('payroll', 'PayrollLineItem')
+    sources = [
+        (PayrollResult.objects.all(), lambda r: {'result_id': r.id, 'employee_id': r.employee_id}),
+        (ArchivedPayrollResult.objects.all(), lambda r: {'archived_result_id': r.id, 'run_id': r.run_id, 'employee_id': r.employee_id}),
+    ]
+    for queryset, owner in sources:
+        items = []
+        for record in queryset.iterator(chunk_size=1000):
+            for key, component_type in SNAPSHOT_KEYS:
+                for entry in (record.components_snapshot or {}).get(key, []):
+                    items.append(PayrollLineItem(
+                        type=component_type, amount=Decimal(str(entry.get('amount') or 0)), reason=entry.get('reason'),
+                        source_file=entry.get('source_file'), attachment=_attachment_name(entry.get('attachment_url')), **owner(record)
+                    ))
+            if len(items) >= 1000:
+                PayrollLineItem.objects.bulk_create(items)
+                items = []
+        PayrollLineItem.objects.bulk_create(items)
+
+
+def line_items_to_snapshots(apps, schema_editor):
+    PayrollLineItem = apps.get_model('payroll', 'PayrollLineItem')
+    for model_name, owner_field in (('PayrollResult', 'result'), ('ArchivedPayrollResult', 'archived_result')):
+        model = apps.get_model('payroll', model_name)
+        for record in model.objects.iterator(chunk_size=1000):
+            snapshot = {'incentives': [], 'deductions': []}
+            for item in PayrollLineItem.objects.filter(**{owner_field: record}).order_by('id'):
+                snapshot[f'{item.type}s'].append({
+                    'amount': str(item.amount), 'reason': item.reason, 'source_file': item.source_file,
+                    'attachment_url': f'{settings.MEDIA_URL}{filepath_to_uri(item.attachment.name)}' if item.attachment else None,
+                })
+            record.components_snapshot = snapshot
+            record.save(update_fields=['components_snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0009_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollLineItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('employee_id', models.CharField(max_length=50)),
+                ('type', models.CharField(choices=[('incentive', 'Incentive'), ('deduction', 'Deduction')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('reason', models.CharField(blank=True, max_length=255, null=True)),
+                ('source_file', models.CharField(blank=True, max_length=255, null=True)),
+                ('attachment', models.FileField(blank=True, null=True, upload_to='attachments/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('archived_result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='line_items', to='payroll.archivedpayrollresult')),
+                ('result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='line_items', to='payroll.payrollresult')),
+                ('run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='line_items', to='payroll.payrollrun')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run', 'employee_id'], name='payroll_pay_run_id_f2ed06_idx'), models.Index(fields=['employee_id'], name='payroll_pay_employe_9c50fc_idx'), models.Index(fields=['source_file'], name='payroll_pay_source__ffbf82_idx'), models.Index(fields=['type', 'amount'], name='payroll_pay_type_b4c42f_idx')],
+            },
+        ),
+        migrations.RunPython(snapshots_to_line_items, line_items_to_snapshots),
+        migrations.RemoveField(
+            model_name='archivedpayrollresult',
+            name='components_snapshot',
+        ),
+        migrations.RemoveField(
+            model_name='payrollresult',
+            name='components_snapshot',
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:27
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rollups(apps, schema_editor):
+    PayrollRun = apps.get_model('payroll', 'PayrollRun')
+    ArchivedPayrollResult = apps.get_model('payroll', 'ArchivedPayrollResult')
+    for run in PayrollRun.objects.all():
+        PayrollRun.objects.filter(pk=run.pk).update(**ArchivedPayrollResult.objects.filter(run_id=run.pk).aggregate(
+            headcount=Count('id'),
+            approved_count=Count('id', filter=Q(status='approved')),
+            rejected_count=Count('id', filter=Q(status='rejected')),
+            pending_count=Count('id', filter=Q(status='pending')),
+            total_base_salary=Sum('base_salary', default=Decimal('0')),
+            total_incentives=Sum('total_incentives', default=Decimal('0')),
+            total_deductions=Sum('total_deductions', default=Decimal('0')),
+            total_final_salary=Sum('final_salary', default=Decimal('0')),
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0010_payrolllineitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payrollrun',
+            name='approved_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payrollrun',
+            name='headcount',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payrollrun',
+            name='pending_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payrollrun',
+            name='rejected_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payrollrun',
+            name='total_base_salary',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='payrollrun',
+            name='total_deductions',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='payrollrun',
+            name='total_final_salary',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='payrollrun',
+            name='total_incentives',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0011_payrollrun_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='component',
+            name='source_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
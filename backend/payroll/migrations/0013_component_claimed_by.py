@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0012_component_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='component',
+            name='claimed_by',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
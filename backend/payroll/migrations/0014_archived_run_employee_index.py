@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0013_component_claimed_by'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedpayrollresult',
+            index=models.Index(fields=['run', 'employee_id'], name='payroll_arc_run_id_adf461_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:34
+
+from django.db import migrations, models
+
+# Standalone FTS5 index over Employee, kept in sync by triggers. `doc_key` ('x' + hex of the id) is a single
+# alphanumeric token, so the triggers can find an employee's row through the index instead of scanning it.
+CREATE_SEARCH_INDEX = [
+    """CREATE VIRTUAL TABLE payroll_employee_fts USING fts5(employee_id, name, doc_key)""",
+    """INSERT INTO payroll_employee_fts (employee_id, name, doc_key)
+       SELECT employee_id, name, 'x' || hex(employee_id) FROM payroll_employee""",
+    """CREATE TRIGGER payroll_employee_fts_insert AFTER INSERT ON payroll_employee BEGIN
+       INSERT INTO payroll_employee_fts (employee_id, name, doc_key) VALUES (new.employee_id, new.name, 'x' || hex(new.employee_id));
+       END""",
+    """CREATE TRIGGER payroll_employee_fts_delete AFTER DELETE ON payroll_employee BEGIN
+       DELETE FROM payroll_employee_fts WHERE payroll_employee_fts MATCH 'doc_key:x' || hex(old.employee_id);
+       END""",
+    """CREATE TRIGGER payroll_employee_fts_update AFTER UPDATE OF employee_id, name ON payroll_employee
+       WHEN old.employee_id IS NOT new.employee_id OR old.name IS NOT new.name BEGIN
+       DELETE FROM payroll_employee_fts WHERE payroll_employee_fts MATCH 'doc_key:x' || hex(old.employee_id);
+       INSERT INTO payroll_employee_fts (employee_id, name, doc_key) VALUES (new.employee_id, new.name, 'x' || hex(new.employee_id));
+       END""",
+]
+DROP_SEARCH_INDEX = [
+    'DROP TRIGGER IF EXISTS payroll_employee_fts_insert',
+    'DROP TRIGGER IF EXISTS payroll_employee_fts_delete',
+    'DROP TRIGGER IF EXISTS payroll_employee_fts_update',
+    'DROP TABLE IF EXISTS payroll_employee_fts',
+]
+
+
+def _execute(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite-only; other databases keep the LIKE-based SearchFilter.
+        if schema_editor.connection.vendor != 'sqlite': return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0014_archived_run_employee_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payrollresult',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='payroll_pay_status_fd6a91_idx'),
+        ),
+        migrations.RunPython(_execute(CREATE_SEARCH_INDEX), _execute(DROP_SEARCH_INDEX)),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:28
+
+import payroll.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0015_employee_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='component',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=payroll.storage.attachment_storage, upload_to='attachments/'),
+        ),
+        migrations.AlterField(
+            model_name='payrolllineitem',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=payroll.storage.attachment_storage, upload_to='attachments/'),
+        ),
+    ]
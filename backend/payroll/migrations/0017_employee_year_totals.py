@@ -0,0 +1,61 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:31
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractYear
+
+
+def backfill_year_totals(apps, schema_editor):
+    PayrollRun = apps.get_model('payroll', 'PayrollRun')
+    ArchivedPayrollResult = apps.get_model('payroll', 'ArchivedPayrollResult')
+    EmployeeYearTotals = apps.get_model('payroll', 'EmployeeYearTotals')
+    rows = (
+        ArchivedPayrollResult.objects.annotate(year=ExtractYear('run__run_timestamp'))
+        .values('employee_id', 'year')
+        .annotate(
+            run_count=Count('run', distinct=True),
+            total_incentives=Sum('total_incentives', default=Decimal('0')),
+            total_deductions=Sum('total_deductions', default=Decimal('0')),
+            total_final_salary=Sum('final_salary', default=Decimal('0')),
+        )
+        .order_by()
+    )
+    EmployeeYearTotals.objects.bulk_create((EmployeeYearTotals(**row) for row in rows.iterator()), batch_size=1000)
+    PayrollRun.objects.update(in_employee_totals=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0016_attachment_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeeYearTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('employee_id', models.CharField(max_length=50)),
+                ('year', models.PositiveSmallIntegerField()),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('total_incentives', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_deductions', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_final_salary', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='payrollrun',
+            name='in_employee_totals',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpayrollresult',
+            index=models.Index(fields=['employee_id', 'run'], name='payroll_arc_employe_eb63c8_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='employeeyeartotals',
+            constraint=models.UniqueConstraint(fields=('employee_id', 'year'), name='payroll_employee_year_totals'),
+        ),
+        migrations.RunPython(backfill_year_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_heartbeats(apps, schema_editor):
+    # Jobs already running count from their start.
+    Job = apps.get_model('payroll', 'Job')
+    Job.objects.filter(state='running').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0017_employee_year_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_heartbeats, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 # payroll/models.py
 from django.db import models
+from django.utils import timezone
+from .storage import attachment_storage
 
 class Employee(models.Model):
     employee_id = models.CharField(max_length=50, unique=True, primary_key=True)
@@ -15,7 +17,11 @@ class Component(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     reason = models.CharField(max_length=255, blank=True, null=True)
     source_file = models.CharField(max_length=255, blank=True, null=True)
-    attachment = models.FileField(upload_to='attachments/', blank=True, null=True)
+    # SHA-256 of the uploaded sheet; flags re-uploads of the same file before the next generation.
+    source_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    # Set by a running payroll generation to mark the components it consumes; uploads made meanwhile stay unclaimed.
+    claimed_by = models.UUIDField(blank=True, null=True, db_index=True)
+    attachment = models.FileField(upload_to='attachments/', storage=attachment_storage, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -28,18 +34,35 @@ class PayrollResult(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     rejection_reason = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    components_snapshot = models.JSONField(default=dict)
     class Meta:
         ordering = ['-created_at']
+        # Backs keyset pagination of the results list, unfiltered and filtered by status.
+        indexes = [models.Index(fields=['-created_at', '-id']), models.Index(fields=['status', '-created_at', '-id'])]
+
+    @property
+    def components_snapshot(self):
+        return build_snapshot(self.line_items.all())
 
 class PayrollRun(models.Model):
     """Represents a single, timestamped instance of a payroll calculation."""
     run_timestamp = models.DateTimeField(auto_now_add=True)
     # NEW: A field to give a custom name to the payroll run.
     run_name = models.CharField(max_length=255, blank=True, null=True)
+    # Rollups of the run's archived results, written once at archive time.
+    headcount = models.PositiveIntegerField(default=0)
+    approved_count = models.PositiveIntegerField(default=0)
+    rejected_count = models.PositiveIntegerField(default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    total_base_salary = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_incentives = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_deductions = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_final_salary = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Whether the run's results are counted in EmployeeYearTotals; cleared (once) when the run is deleted.
+    in_employee_totals = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['-run_timestamp']
+        indexes = [models.Index(fields=['-run_timestamp', '-id'])]
 
     def __str__(self):
         return self.run_name or f"Payroll Run at {self.run_timestamp.strftime('%Y-%m-%d %H:%M')}"
@@ -55,4 +78,89 @@ class ArchivedPayrollResult(models.Model):
     final_salary = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=10)
     rejection_reason = models.TextField(blank=True, null=True)
-    components_snapshot = models.JSONField(default=dict)
+
+    class Meta:
+        # Keyset pagination of a run's archived results; per-employee lookups within a run (archiving re-points line items through it);
+        # one employee's runs, newest first, for the employee history.
+        indexes = [models.Index(fields=['run', 'id']), models.Index(fields=['run', 'employee_id']), models.Index(fields=['employee_id', 'run'])]
+
+    @property
+    def components_snapshot(self):
+        return build_snapshot(self.line_items.all())
+
+class EmployeeYearTotals(models.Model):
+    """
+    Cumulative archived totals of one employee in one calendar year (by run timestamp). Maintained incrementally:
+    archiving a run adds its results, deleting a run subtracts them.
+    """
+    employee_id = models.CharField(max_length=50)
+    year = models.PositiveSmallIntegerField()
+    run_count = models.PositiveIntegerField(default=0)
+    total_incentives = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_deductions = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_final_salary = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['employee_id', 'year'], name='payroll_employee_year_totals')]
+
+class PayrollLineItem(models.Model):
+    """
+    One incentive or deduction folded into a payroll result. While the result is current `result` is set;
+    archiving moves the row to `archived_result`/`run`. The components snapshot is rebuilt from these rows.
+    """
+    result = models.ForeignKey(PayrollResult, on_delete=models.CASCADE, related_name='line_items', blank=True, null=True)
+    archived_result = models.ForeignKey(ArchivedPayrollResult, on_delete=models.CASCADE, related_name='line_items', blank=True, null=True)
+    run = models.ForeignKey(PayrollRun, on_delete=models.CASCADE, related_name='line_items', blank=True, null=True)
+    employee_id = models.CharField(max_length=50)
+    type = models.CharField(max_length=10, choices=Component.COMPONENT_TYPE_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    reason = models.CharField(max_length=255, blank=True, null=True)
+    source_file = models.CharField(max_length=255, blank=True, null=True)
+    attachment = models.FileField(upload_to='attachments/', storage=attachment_storage, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run', 'employee_id']),
+            models.Index(fields=['employee_id']),
+            models.Index(fields=['source_file']),
+            models.Index(fields=['type', 'amount']),
+        ]
+
+def build_snapshot(line_items):
+    """Rebuilds the {'incentives': [...], 'deductions': [...]} snapshot served by the API from line items."""
+    snapshot = {'incentives': [], 'deductions': []}
+    for item in sorted(line_items, key=lambda item: item.id):
+        snapshot[f'{item.type}s'].append({
+            'amount': str(item.amount), 'reason': item.reason, 'source_file': item.source_file,
+            'attachment_url': item.attachment.url if item.attachment else None,
+        })
+    return snapshot
+
+class Job(models.Model):
+    """A unit of background work (upload, generate, archive) executed by the `run_payroll_worker` command."""
+    KIND_CHOICES = [
+        ('upload_employee', 'Upload Employee Sheet'), ('upload_component', 'Upload Component Sheets'),
+        ('generate', 'Generate Payroll'), ('archive', 'Archive Payroll'),
+    ]
+    STATE_CHOICES = [('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='queued', db_index=True)
+    payload = models.JSONField(default=dict)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Renewed while a worker reports progress; a running job whose heartbeat goes stale lost its worker.
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def elapsed_ms(self):
+        if not self.started_at: return None
+        end = self.finished_at or timezone.now()
+        return round((end - self.started_at).total_seconds() * 1000, 2)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.state})"
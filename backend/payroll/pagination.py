@@ -0,0 +1,21 @@
+# payroll/pagination.py
+from rest_framework.pagination import CursorPagination
+
+class KeysetPagination(CursorPagination):
+    """
+    Opt-in cursor (keyset) pagination. Requests without `cursor` or `page_size` still get the plain list
+    the dashboard expects; otherwise the response is {next, previous, results}. Views choose the key
+    with a `cursor_ordering` attribute, e.g. ('-created_at', '-id').
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = ('-id',)
+
+    def get_page_size(self, request):
+        if self.cursor_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().get_page_size(request)
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
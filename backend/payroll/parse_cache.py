@@ -0,0 +1,116 @@
+# payroll/parse_cache.py
+import csv
+import gzip
+import hashlib
+import os
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from django.conf import settings
+
+# Upper bound for the on-disk parse cache; least recently used entries are evicted past it.
+PARSE_CACHE_MAX_BYTES = getattr(settings, 'PAYROLL_PARSE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+
+# Part of every entry name. Bump it whenever ingest's normalization (amount parsing, bounds, line numbering) or the
+# entry layout changes, so entries written by an older parser are never read back after a deploy.
+PARSER_VERSION = 2
+
+def cache_dir():
+    return Path(settings.MEDIA_ROOT) / 'parse_cache'
+
+def init_worker(media_root):
+    """
+    Initializer of spawned parse workers: sets Django up and uses the parent's MEDIA_ROOT as in effect when the pool
+    started, so entries are written where the parent reads them. This module imports no models, so it loads first.
+    """
+    import django
+    django.setup()
+    settings.MEDIA_ROOT = media_root
+
+def _entry(fingerprint):
+    return cache_dir() / f'{PARSER_VERSION}-{fingerprint}.csv.gz'
+
+def file_fingerprint(path):
+    """SHA-256 of the file's bytes, used both as the cache key and to spot re-uploads."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def contains(fingerprint):
+    return _entry(fingerprint).exists()
+
+class CorruptEntry(ValueError):
+    """A cache entry could not be decoded; it has been deleted, so the sheet should be parsed again."""
+
+def load(fingerprint, chunk_size):
+    """
+    Opens the cached normalized (line, employee_id, amount, reason) rows of a sheet, or returns None on a miss.
+    The rows are read lazily in lists of at most chunk_size; values are already clean, so no pandas or regex work
+    is needed. A hit refreshes the entry's LRU position. An unreadable entry raises CorruptEntry while iterating.
+    """
+    path = _entry(fingerprint)
+    try: handle = gzip.open(path, 'rt', newline='')
+    except FileNotFoundError: return None
+    try: os.utime(path)
+    except FileNotFoundError: pass
+    return _read_chunks(path, handle, chunk_size)
+
+def _read_chunks(path, handle, chunk_size):
+    try:
+        with handle:
+            batch = []
+            for line, employee_id, amount, reason in csv.reader(handle):
+                batch.append((int(line), employee_id or None, Decimal(amount) if amount else None, reason or None))
+                if len(batch) >= chunk_size:
+                    yield batch
+                    batch = []
+            if batch: yield batch
+    except (OSError, EOFError, ValueError, InvalidOperation, csv.Error) as e:
+        path.unlink(missing_ok=True)
+        raise CorruptEntry(f'Unreadable parse cache entry {path.name}: {e}')
+
+class _EntryWriter:
+    def __init__(self, handle):
+        self._writer = csv.writer(handle)
+
+    def write(self, rows):
+        self._writer.writerows(
+            (line, employee_id or '', '' if amount is None else str(amount), reason or '') for line, employee_id, amount, reason in rows
+        )
+
+@contextmanager
+def writer(fingerprint):
+    """Streams normalized rows into a gzip'd CSV entry that is published atomically if the block succeeds."""
+    directory = cache_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    temp_path = directory / f'{fingerprint}.{os.getpid()}.tmp'
+    try:
+        with gzip.open(temp_path, 'wt', newline='') as handle:
+            yield _EntryWriter(handle)
+        os.replace(temp_path, _entry(fingerprint))
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    evict(keep=_entry(fingerprint))
+
+def evict(max_bytes=PARSE_CACHE_MAX_BYTES, keep=None):
+    """
+    Deletes entries of older parser versions, then least recently used entries other than `keep` until the cache
+    fits in max_bytes.
+    """
+    entries = []
+    for path in cache_dir().glob('*.csv.gz'):
+        if not path.name.startswith(f'{PARSER_VERSION}-'):
+            path.unlink(missing_ok=True)
+            continue
+        try: stat = path.stat()
+        except FileNotFoundError: continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes: break
+        if path == keep: continue
+        path.unlink(missing_ok=True)
+        total -= size
@@ -0,0 +1,67 @@
+# payroll/renderers.py
+import datetime
+from decimal import Decimal
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:  # Optional: ORJSONRenderer falls back to DRF's json.dumps.
+    orjson = None
+try:
+    import msgpack
+except ImportError:  # Optional: MessagePack is only offered when installed.
+    msgpack = None
+
+_datetime_field = serializers.DateTimeField()
+
+def encode_value(value):
+    """Decimal and datetime exactly as DRF's DecimalField / DateTimeField represent them."""
+    if isinstance(value, Decimal): return format(value, 'f') if api_settings.COERCE_DECIMAL_TO_STRING else float(value)
+    if isinstance(value, datetime.datetime): return _datetime_field.to_representation(value)
+    if isinstance(value, (datetime.date, datetime.time)): return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not serializable')
+
+class FastRowEncoder(JSONEncoder):
+    """DRF's JSONEncoder with Decimal and datetime values encoded by encode_value, as fast-path rows need."""
+    def default(self, obj):
+        if isinstance(obj, (Decimal, datetime.date, datetime.time)): return encode_value(obj)
+        return super().default(obj)
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Byte-compatible with DRF's compact JSONRenderer, but encodes with orjson (Decimal and datetime
+    included, see encode_value). Indented output and missing orjson fall back to the parent, whose
+    FastRowEncoder gives raw fast-path values the same representation.
+    """
+    encoder_class = FastRowEncoder
+    fast_rows = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None: return b''
+        if orjson is None or not self.compact or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        content = orjson.dumps(data, default=encode_value, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        # Same strict-JavaScript-subset escaping as JSONRenderer.
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+class MessagePackRenderer(BaseRenderer):
+    """`Accept: application/msgpack`: the JSON document's values, MessagePack-encoded."""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    fast_rows = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None: return b''
+        return msgpack.packb(data, default=encode_value, datetime=False)
+
+def list_renderer_classes():
+    """Renderers of the large list endpoints: fast JSON, the browsable API, and MessagePack if installed."""
+    renderers = [ORJSONRenderer] + [renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES if renderer is not JSONRenderer]
+    return renderers + [MessagePackRenderer] if msgpack is not None else renderers
@@ -0,0 +1,72 @@
+# payroll/rows.py
+"""
+Serializer-free rows for the large list endpoints, built from `.values()` in the exact key order of
+PayrollResultSerializer / ArchivedPayrollResultSerializer. Decimals and datetimes are left for the
+renderer (see renderers.encode_value).
+"""
+from asgiref.sync import sync_to_async
+from .models import PayrollLineItem
+
+RESULT_VALUES = (
+    'id', 'employee_id', 'employee__name', 'employee__phone', 'employee__age', 'employee__base_salary',
+    'total_incentives', 'total_deductions', 'final_salary', 'status', 'rejection_reason', 'created_at',
+)
+ARCHIVED_RESULT_VALUES = (
+    'id', 'employee_id', 'employee_name', 'base_salary', 'total_incentives', 'total_deductions',
+    'final_salary', 'status', 'rejection_reason', 'run_id',
+)
+
+def _snapshot_items(owner_field, owners):
+    return (
+        PayrollLineItem.objects.filter(**{f'{owner_field}__in': owners}).order_by('id')
+        .values_list(owner_field, 'type', 'amount', 'reason', 'source_file', 'attachment')
+    )
+
+def _add_to_snapshot(by_owner, storage_url, item):
+    owner, component_type, amount, reason, source_file, attachment = item
+    snapshot = by_owner.get(owner)
+    if snapshot is None: snapshot = by_owner[owner] = {'incentives': [], 'deductions': []}
+    snapshot[f'{component_type}s'].append({
+        'amount': str(amount), 'reason': reason, 'source_file': source_file,
+        'attachment_url': storage_url(attachment) if attachment else None,
+    })
+
+def snapshots(owner_field, owners):
+    """{owner id: components snapshot} for the line items whose `owner_field` is in `owners`, as build_snapshot() builds it."""
+    by_owner, storage_url = {}, PayrollLineItem._meta.get_field('attachment').storage.url
+    for item in _snapshot_items(owner_field, owners).iterator(chunk_size=5000):
+        _add_to_snapshot(by_owner, storage_url, item)
+    return by_owner
+
+async def asnapshots(owner_field, owners):
+    """
+    snapshots() from async code, in one hop to a thread: values_list().aiterator() runs its query on the event
+    loop in Django 5.2, and fetching everything at once would lose the chunked streaming.
+    """
+    return await sync_to_async(snapshots)(owner_field, owners)
+
+def _empty_snapshot():
+    return {'incentives': [], 'deductions': []}
+
+def result_row(values, snapshots):
+    return {
+        'id': values['id'],
+        'employee': {
+            'employee_id': values['employee_id'], 'name': values['employee__name'], 'phone': values['employee__phone'],
+            'age': values['employee__age'], 'base_salary': values['employee__base_salary'],
+        },
+        'total_incentives': values['total_incentives'], 'total_deductions': values['total_deductions'],
+        'final_salary': values['final_salary'], 'status': values['status'], 'rejection_reason': values['rejection_reason'],
+        'created_at': values['created_at'],
+        'components_snapshot': snapshots.get(values['id']) or _empty_snapshot(),
+    }
+
+def archived_result_row(values, snapshots):
+    return {
+        'id': values['id'], 'employee_id': values['employee_id'], 'employee_name': values['employee_name'],
+        'base_salary': values['base_salary'], 'total_incentives': values['total_incentives'],
+        'total_deductions': values['total_deductions'], 'final_salary': values['final_salary'],
+        'status': values['status'], 'rejection_reason': values['rejection_reason'],
+        'components_snapshot': snapshots.get(values['id']) or _empty_snapshot(),
+        'run': values['run_id'],
+    }
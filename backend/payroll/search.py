@@ -0,0 +1,23 @@
+# payroll/search.py
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+SEARCH_TABLE = 'payroll_employee_fts'
+
+def match_query(terms):
+    """FTS5 query requiring every term as a prefix of an employee id or name token, e.g. `{employee_id name} : "jo"* AND "sal"*`."""
+    phrases = ['"{}"*'.format(term.replace('"', '""')) for term in terms]
+    return '{employee_id name} : ' + ' AND '.join(phrases)
+
+class EmployeeSearchFilter(SearchFilter):
+    """
+    `?search=` backed by the FTS5 employee index on SQLite: each term prefix-matches an id or name token.
+    Other databases fall back to SearchFilter's LIKE lookups over the view's `search_fields`.
+    `search_employee_field` names the field holding the employee id on the view's model.
+    """
+    def filter_queryset(self, request, queryset, view):
+        terms = [term for term in self.get_search_terms(request) if any(char.isalnum() for char in term)]
+        if not terms or connection.vendor != 'sqlite': return super().filter_queryset(request, queryset, view)
+        matches = RawSQL(f'SELECT employee_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match_query(terms)])
+        return queryset.filter(**{f"{getattr(view, 'search_employee_field', 'employee_id')}__in": matches})
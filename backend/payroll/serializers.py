@@ -1,21 +1,36 @@
 # payroll/serializers.py
 from rest_framework import serializers
-from .models import Employee, Component, PayrollResult, PayrollRun, ArchivedPayrollResult
+from .models import Employee, Component, PayrollResult, PayrollRun, ArchivedPayrollResult, Job, PayrollLineItem
 
-class EmployeeSerializer(serializers.ModelSerializer):
+class FieldSelectionMixin:
+    """Accepts a `fields` kwarg: when given, only those of the serializer's fields are kept."""
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class EmployeeSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     class Meta:
         model = Employee
         fields = ['employee_id', 'name', 'phone', 'age', 'base_salary']
 
-class PayrollResultSerializer(serializers.ModelSerializer):
+class PayrollResultSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     employee = EmployeeSerializer(read_only=True)
     class Meta:
         model = PayrollResult
-        fields = '__all__'
+        fields = [
+            'id', 'employee', 'total_incentives', 'total_deductions', 'final_salary', 'status',
+            'rejection_reason', 'created_at', 'components_snapshot',
+        ]
 
 class RejectPayrollSerializer(serializers.Serializer):
     reason = serializers.CharField(required=True, allow_blank=False, max_length=500)
 
+class BulkPayrollActionSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    reason = serializers.CharField(required=False, allow_blank=False, max_length=500)
+
 class ManualComponentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Component
@@ -23,16 +38,34 @@ class ManualComponentSerializer(serializers.ModelSerializer):
 
 # --- NEW SERIALIZERS FOR HISTORY ---
 
-class ArchivedPayrollResultSerializer(serializers.ModelSerializer):
+class ArchivedPayrollResultSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     """Serializer for the read-only archived results."""
     class Meta:
         model = ArchivedPayrollResult
-        fields = '__all__'
+        fields = [
+            'id', 'employee_id', 'employee_name', 'base_salary', 'total_incentives', 'total_deductions',
+            'final_salary', 'status', 'rejection_reason', 'components_snapshot', 'run',
+        ]
 
-class PayrollRunSerializer(serializers.ModelSerializer):
+class PayrollRunSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     """Serializer for listing the historical payroll runs."""
     # Optionally, you can nest the results here if you want all data at once,
     # but it's more efficient to fetch them on demand.
     class Meta:
         model = PayrollRun
-        fields = ['id', 'run_timestamp']
+        fields = [
+            'id', 'run_timestamp', 'headcount', 'approved_count', 'rejected_count', 'pending_count',
+            'total_base_salary', 'total_incentives', 'total_deductions', 'total_final_salary',
+        ]
+
+class PayrollLineItemSerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    class Meta:
+        model = PayrollLineItem
+        fields = ['id', 'result', 'archived_result', 'run', 'employee_id', 'type', 'amount', 'reason', 'source_file', 'attachment', 'created_at']
+
+class JobSerializer(serializers.ModelSerializer):
+    """Progress view of a background job, polled by the dashboard."""
+    elapsed_ms = serializers.ReadOnlyField()
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'state', 'rows_processed', 'elapsed_ms', 'result', 'error', 'created_at', 'started_at', 'finished_at']
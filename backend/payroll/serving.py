@@ -0,0 +1,106 @@
+# payroll/serving.py
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from .storage import ATTACHMENT_DIR, attachment_storage, blob_digest
+from .streaming import file_response, stream
+
+# None streams files from Django; 'x-sendfile' (Apache mod_xsendfile, lighttpd) or 'x-accel-redirect' (nginx)
+# hands the transfer, including Range requests, to the front server so file bytes never pass through Python.
+ATTACHMENT_OFFLOAD = getattr(settings, 'PAYROLL_ATTACHMENT_OFFLOAD', None)
+# nginx `internal` location aliased to MEDIA_ROOT, used with 'x-accel-redirect'.
+ATTACHMENT_ACCEL_PREFIX = getattr(settings, 'PAYROLL_ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+RANGE_CHUNK_SIZE = 64 * 1024
+# Types shown inline in the browser; anything else (HTML, SVG, ...) is forced to download.
+INLINE_TYPES = ('application/pdf', 'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'text/plain')
+
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+
+def _resolve(name):
+    """Absolute path of an attachment, refusing anything outside MEDIA_ROOT/attachments and in-flight uploads."""
+    root = os.path.realpath(attachment_storage().path(ATTACHMENT_DIR))
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep) or path.endswith('.part'): raise Http404('Attachment not found.')
+    try:
+        info = os.stat(path)
+    except OSError:
+        raise Http404('Attachment not found.')
+    if not stat.S_ISREG(info.st_mode): raise Http404('Attachment not found.')
+    return path, info
+
+def _byte_range(request, size, etag, last_modified):
+    """(start, end) of a single satisfiable `Range: bytes=...`, None to send the whole file, or False if unsatisfiable."""
+    match = _RANGE.fullmatch(request.META.get('HTTP_RANGE', '').strip())
+    if not match or match.groups() == ('', ''): return None
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified: return None
+    first, last = match.groups()
+    if size == 0: return False
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start: return None
+        if start >= size: return False
+    else:
+        if int(last) == 0: return False
+        start, end = max(size - int(last), 0), size - 1
+    return start, end
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk: return
+            length -= len(chunk)
+            yield chunk
+
+def serve_attachment(request, name):
+    """
+    Serves MEDIA_ROOT/attachments/<name> with ETag/Last-Modified validators (304/412 handled), single byte ranges
+    (206/416) and optional X-Sendfile/X-Accel-Redirect offload. Bodies are streamed; blobs are cached as immutable.
+    """
+    path, info = _resolve(name)
+    digest = blob_digest(f'{ATTACHMENT_DIR}/{name}')
+    etag = f'"{digest}"' if digest else f'"{info.st_mtime_ns:x}-{info.st_size:x}"'
+    last_modified = int(info.st_mtime)
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    def finish(response):
+        response['ETag'], response['Last-Modified'] = etag, http_date(last_modified)
+        if digest: patch_cache_control(response, private=True, max_age=365 * 24 * 3600, immutable=True)
+        else: patch_cache_control(response, private=True, no_cache=True)
+        if response.status_code != 304:
+            response['Content-Disposition'] = 'inline' if content_type in INLINE_TYPES else 'attachment'
+        return response
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None: return finish(conditional) if conditional.status_code == 304 else conditional
+    if ATTACHMENT_OFFLOAD == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return finish(response)
+    if ATTACHMENT_OFFLOAD == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(f'{ATTACHMENT_ACCEL_PREFIX.rstrip("/")}/{ATTACHMENT_DIR}/{name}')
+        return finish(response)
+
+    byte_range = _byte_range(request, info.st_size, etag, last_modified)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{info.st_size}'
+        return response
+    if byte_range is None:
+        response = file_response(request, open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(stream(request, _read_range(path, start, end - start + 1)), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{info.st_size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return finish(response)
@@ -0,0 +1,66 @@
+# payroll/storage.py
+import hashlib
+import os
+import tempfile
+from pathlib import PurePosixPath
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+ATTACHMENT_DIR = 'attachments'
+BLOB_DIR = f'{ATTACHMENT_DIR}/blobs'
+# URL prefix of AttachmentView; attachment URLs point there instead of MEDIA_URL.
+ATTACHMENT_URL = getattr(settings, 'PAYROLL_ATTACHMENT_URL', '/api/attachments/')
+
+class AttachmentStorage(FileSystemStorage):
+    """
+    Content-addressed attachment store under MEDIA_ROOT. Uploads are streamed to disk chunk by chunk while
+    hashed and kept once per SHA-256 as attachments/blobs/<2 hex>/<sha256><ext>, so every entry carrying the
+    same scan shares one file. Blobs are never overwritten; attachments saved before this storage keep their names.
+    """
+    def __init__(self):
+        # No explicit location, so MEDIA_ROOT is read lazily and follows override_settings.
+        super().__init__(base_url=ATTACHMENT_URL)
+
+    def get_available_name(self, name, max_length=None):
+        # _save picks the final, content-derived name; an existing file of the same name is not a conflict.
+        return name
+
+    def _save(self, name, content):
+        suffix = PurePosixPath(name).suffix.lower()[:10]
+        blobs = self.path(BLOB_DIR)
+        os.makedirs(blobs, exist_ok=True)
+        digest = hashlib.sha256()
+        handle, temp_path = tempfile.mkstemp(dir=blobs, suffix='.part')
+        try:
+            with os.fdopen(handle, 'wb') as temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            hexdigest = digest.hexdigest()
+            blob_name = f'{BLOB_DIR}/{hexdigest[:2]}/{hexdigest}{suffix}'
+            blob_path = self.path(blob_name)
+            if os.path.exists(blob_path):
+                os.unlink(temp_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                if self.file_permissions_mode is not None: os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, blob_path)
+        except BaseException:
+            if os.path.exists(temp_path): os.unlink(temp_path)
+            raise
+        return blob_name
+
+    def delete(self, name):
+        # Blobs are shared by every entry with the same content; removing one entry must not remove the file.
+        if not name.startswith(f'{BLOB_DIR}/'): super().delete(name)
+
+    def url(self, name):
+        return super().url(name.removeprefix(f'{ATTACHMENT_DIR}/'))
+
+def attachment_storage():
+    return AttachmentStorage()
+
+def blob_digest(name):
+    """SHA-256 of a content-addressed blob name, or None for attachments stored before deduplication."""
+    if not name.startswith(f'{BLOB_DIR}/'): return None
+    return PurePosixPath(name).stem
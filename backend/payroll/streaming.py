@@ -0,0 +1,37 @@
+# payroll/streaming.py
+"""
+Streaming response bodies that stay streamed under ASGI. Django's ASGI handler reads a synchronous iterator into a
+list before sending the first byte, which would hold a whole export or attachment in memory; under ASGI the bodies
+below are async iterators that produce one block at a time instead. Under WSGI they are left untouched.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse
+
+# Bytes read per step when a file is streamed to an ASGI server.
+FILE_CHUNK_SIZE = 64 * 1024
+
+_END = object()
+
+def is_asgi(request):
+    # DRF's Request wraps the Django request.
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+async def _pull(blocks):
+    # Each block is produced on the thread sync views run on, so a database cursor stays with its connection.
+    pull = sync_to_async(next)
+    try:
+        while (block := await pull(blocks, _END)) is not _END: yield block
+    finally:
+        if hasattr(blocks, 'close'): await sync_to_async(blocks.close)()
+
+def stream(request, blocks):
+    """`blocks` as the body of a StreamingHttpResponse: as is under WSGI, pulled one block at a time under ASGI."""
+    return _pull(iter(blocks)) if is_asgi(request) else blocks
+
+def file_response(request, handle, **kwargs):
+    """FileResponse for an open file; under ASGI the file is read FILE_CHUNK_SIZE bytes at a time off the event loop."""
+    response = FileResponse(handle, **kwargs)
+    # The headers are already set from the file, and the response still closes it.
+    if is_asgi(request): response.streaming_content = _pull(iter(lambda: handle.read(FILE_CHUNK_SIZE), b''))
+    return response
@@ -1,3 +1,768 @@
-from django.test import TestCase
+# payroll/tests.py
+import csv
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from itertools import chain
+from pathlib import Path
+from unittest import mock
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from . import parse_cache
+from .async_views import AsyncPayrollResultListView
+from .caching import bump_data_version
+from .engine import NothingToArchive, archive_payroll, delete_payroll_run, generate_payroll
+from .history import run_diff
+from .ingest import (
+    MAX_AMOUNT, iter_component_rows, normalize_component_chunk, prepare_employee_frame, process_component_files, process_employee_sheet,
+    read_employee_csv, read_spreadsheet, upsert_employees,
+)
+from .jobs import claim_next_job, enqueue, fail_stale_jobs, run_job
+from .models import ArchivedPayrollResult, Component, Employee, EmployeeYearTotals, Job, PayrollLineItem, PayrollResult, PayrollRun
+from .renderers import ORJSONRenderer
+from .serializers import ArchivedPayrollResultSerializer, PayrollResultSerializer
+from .storage import attachment_storage
 
-# Create your tests here.
+LOCAL_CACHE = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'payroll-tests'}
+
+# Line 3 is blank and Bob's name spans lines 4-5, so sheet line numbers differ from row positions.
+EMPLOYEE_CSV = (
+    'employee_id,name,base_salary\n'
+    'E1,Ann,"$1,200.50"\n'
+    '\n'
+    'E2,"Bob\nJr",900\n'
+    ',Nobody,100\n'
+    'E3,Cid,abc\n'
+    f'E4,Dee,{MAX_AMOUNT}\n'
+    f'E5,Eve,{MAX_AMOUNT + Decimal("0.01")}\n'
+    'E6,Fay,inf\n'
+    'E7,Gus,\n'
+    'E1,Ann B,1300\n'
+)
+EMPLOYEES = [
+    ('E2', 'Bob\nJr', Decimal('900.00')), ('E4', 'Dee', MAX_AMOUNT), ('E7', 'Gus', Decimal('0.00')), ('E1', 'Ann B', Decimal('1300.00')),
+]
+EMPLOYEE_REJECTS = [
+    {'line': 6, 'employee_id': None, 'reason': 'missing employee_id'},
+    {'line': 7, 'employee_id': 'E3', 'reason': 'invalid base_salary'},
+    {'line': 9, 'employee_id': 'E5', 'reason': 'invalid base_salary'},
+    {'line': 10, 'employee_id': 'E6', 'reason': 'invalid base_salary'},
+]
+
+COMPONENT_SHEET = [
+    ('employee_id', 'amount', 'reason'),
+    ('E1', '10.005', 'Bonus'),
+    None,
+    ('E2', '-5', 'Fine'),
+    (None, '3', 'x'),
+    ('E3', 'abc', 'y'),
+    ('E4', str(MAX_AMOUNT), 'z'),
+    ('E5', str(MAX_AMOUNT + Decimal('0.01')), 'big'),
+    ('E6', 'NaN', None),
+]
+COMPONENT_ROWS = [
+    (2, 'E1', Decimal('10.01'), 'Bonus'), (4, 'E2', Decimal('-5.00'), 'Fine'), (5, None, Decimal('3.00'), 'x'),
+    (6, 'E3', None, 'y'), (7, 'E4', MAX_AMOUNT, 'z'), (8, 'E5', None, 'big'), (9, 'E6', None, None),
+]
+
+def _write_csv(path, rows):
+    path.write_text(''.join('\n' if row is None else ','.join(value or '' for value in row) + '\n' for row in rows))
+    return str(path)
+
+def _write_xlsx(path, rows):
+    from openpyxl import Workbook
+    workbook = Workbook()
+    sheet = workbook.active
+    for line, row in enumerate(rows, start=1):
+        for column, value in enumerate(row or (), start=1):
+            if value is not None: sheet.cell(row=line, column=column, value=value)
+    workbook.save(path)
+    return str(path)
+
+@override_settings(CACHES={'default': LOCAL_CACHE})
+class PayrollTestCase(TestCase):
+    """TestCase with its own list response cache, emptied before every test."""
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+
+class UploadMixin:
+    """Uploads sheets through the API into a throwaway MEDIA_ROOT."""
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def upload(self, url, name, content, **data):
+        return self.client.post(url, {'files': [SimpleUploadedFile(name, content.encode())], **data})
+
+class JobTests(PayrollTestCase):
+    """`?async=1` queues the work as a Job; workers claim jobs one at a time and record the outcome."""
+    def run_worker(self):
+        out = StringIO()
+        # close_old_connections() sees the test transaction as a connection left mid-transaction and, on
+        # PostgreSQL, closes it.
+        with mock.patch('payroll.management.commands.run_payroll_worker.close_old_connections'):
+            call_command('run_payroll_worker', '--once', stdout=out)
+        return out.getvalue()
+
+    def test_queued_job_is_claimed_once_and_run(self):
+        response = self.client.post('/api/payroll/generate/?async=1')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/').json()['state'], 'queued')
+        job = claim_next_job()
+        self.assertEqual((job.pk, job.state), (job_id, 'running'))
+        self.assertIsNotNone(job.started_at)
+        self.assertIsNone(claim_next_job())
+        job = run_job(job)
+        self.assertEqual((job.state, job.error, job.result['employees']), ('succeeded', None, 0))
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/').json()['state'], 'succeeded')
+
+    def test_failing_job_records_its_error(self):
+        enqueue('archive')
+        job = run_job(claim_next_job())
+        self.assertEqual((job.state, job.error), ('failed', 'No current payroll results to archive.'))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_worker_drains_the_queue_in_order(self):
+        first, second = enqueue('generate'), enqueue('archive', run_name='October')
+        self.run_worker()
+        self.assertEqual(list(Job.objects.order_by('id').values_list('pk', 'state')), [(first.pk, 'succeeded'), (second.pk, 'failed')])
+
+    def test_jobs_abandoned_by_a_killed_worker_are_failed(self):
+        abandoned, alive = enqueue('generate'), enqueue('generate')
+        claim_next_job(), claim_next_job()
+        Job.objects.filter(pk=abandoned.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=120))
+        self.assertEqual(fail_stale_jobs(timeout=60), 1)
+        abandoned.refresh_from_db()
+        self.assertEqual(abandoned.state, 'failed')
+        self.assertIn('no heartbeat', abandoned.error)
+        self.assertEqual(Job.objects.get(pk=alive.pk).state, 'running')
+        Job.objects.filter(pk=alive.pk).update(heartbeat_at=timezone.now() - timedelta(days=1))
+        out = self.run_worker()
+        self.assertEqual(Job.objects.get(pk=alive.pk).state, 'failed')
+        self.assertIn('Failed 1 job(s)', out)
+
+    def test_progress_renews_the_heartbeat(self):
+        enqueue('upload_employee', filename='missing.csv')
+        job = claim_next_job()
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(days=1))
+        with mock.patch('payroll.jobs.process_employee_sheet', lambda filename, progress: progress(5) or {'inserted': 5, 'updated': 0}):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.rows_processed), ('succeeded', 5))
+        self.assertGreater(job.heartbeat_at, timezone.now() - timedelta(minutes=1))
+
+class KeysetPaginationTests(PayrollTestCase):
+    """Lists stay plain unless a cursor or page_size is given; pages then walk the keyset without gaps or repeats."""
+    def setUp(self):
+        Employee.objects.bulk_create([Employee(employee_id=f'E{i}', name=f'Employee {i}', base_salary=Decimal('100.00')) for i in range(5)])
+
+    def walk(self, url):
+        seen = []
+        while url:
+            page = self.client.get(url).json()
+            seen.append(page['results'])
+            url = page['next']
+        return seen
+
+    def test_plain_list_without_paging_parameters(self):
+        self.assertEqual([row['employee_id'] for row in self.client.get('/api/employees/').json()], [f'E{i}' for i in range(5)])
+
+    def test_pages_follow_the_keyset(self):
+        pages = self.walk('/api/employees/?page_size=2&fields=employee_id')
+        self.assertEqual(pages, [[{'employee_id': 'E0'}, {'employee_id': 'E1'}], [{'employee_id': 'E2'}, {'employee_id': 'E3'}], [{'employee_id': 'E4'}]])
+
+    def test_ties_on_the_timestamp_are_broken_by_id(self):
+        results = PayrollResult.objects.bulk_create([PayrollResult(employee_id=f'E{i}', final_salary=Decimal('100.00')) for i in range(5)])
+        PayrollResult.objects.update(created_at=timezone.now())
+        pages = self.walk('/api/payroll/results/?page_size=2&fields=id')
+        self.assertEqual([row['id'] for page in pages for row in page], sorted((result.pk for result in results), reverse=True))
+
+class EngineTests(PayrollTestCase):
+    """Generation, archiving and run deletion through their set-based statements."""
+    def setUp(self):
+        Employee.objects.bulk_create([
+            Employee(employee_id='E1', name='Ann', base_salary=Decimal('1000.00')),
+            Employee(employee_id='E2', name='Bob', base_salary=Decimal('2000.00')),
+        ])
+
+    def add(self, employee_id, component_type, amount):
+        Component.objects.create(employee_id=employee_id, type=component_type, amount=Decimal(amount), source_file='sheet.csv')
+
+    def test_generate_writes_results_and_line_items(self):
+        self.add('E1', 'incentive', '100.50')
+        self.add('E1', 'deduction', '20.25')
+        self.add('E2', 'incentive', '5.00')
+        stats = generate_payroll()
+        self.assertEqual((stats['employees'], stats['components'], stats['created']), (2, 3, 2))
+        self.assertFalse(Component.objects.exists())
+        ann = PayrollResult.objects.get(employee_id='E1')
+        self.assertEqual((ann.total_incentives, ann.total_deductions, ann.final_salary), (Decimal('100.50'), Decimal('20.25'), Decimal('1080.25')))
+        self.assertEqual(
+            sorted(ann.line_items.values_list('type', 'amount', 'source_file')),
+            [('deduction', Decimal('20.25'), 'sheet.csv'), ('incentive', Decimal('100.50'), 'sheet.csv')],
+        )
+        self.add('E1', 'incentive', '9.50')
+        self.assertEqual(generate_payroll()['updated'], 1)
+        ann.refresh_from_db()
+        self.assertEqual((ann.total_incentives, ann.final_salary, ann.line_items.count()), (Decimal('110.00'), Decimal('1089.75'), 3))
+
+    def test_archive_copies_results_and_repoints_line_items(self):
+        self.add('E1', 'incentive', '100.50')
+        self.add('E2', 'deduction', '50.00')
+        generate_payroll()
+        PayrollResult.objects.filter(employee_id='E2').update(status='rejected', rejection_reason='Check')
+        summary = archive_payroll('October')
+        run = PayrollRun.objects.get(pk=summary['run_id'])
+        self.assertEqual((summary['archived'], summary['line_items']), (2, 2))
+        self.assertFalse(PayrollResult.objects.exists())
+        self.assertEqual(
+            sorted(run.archived_results.values_list('employee_id', 'employee_name', 'base_salary', 'final_salary', 'status', 'rejection_reason')),
+            [('E1', 'Ann', Decimal('1000.00'), Decimal('1100.50'), 'pending', None), ('E2', 'Bob', Decimal('2000.00'), Decimal('1950.00'), 'rejected', 'Check')],
+        )
+        for item in PayrollLineItem.objects.all():
+            self.assertEqual((item.run_id, item.result_id, item.archived_result.employee_id), (run.pk, None, item.employee_id))
+        self.assertEqual(
+            (run.run_name, run.headcount, run.pending_count, run.rejected_count, run.total_incentives, run.total_final_salary, run.in_employee_totals),
+            ('October', 2, 1, 1, Decimal('100.50'), Decimal('3050.50'), True),
+        )
+        with self.assertRaises(NothingToArchive): archive_payroll()
+
+    def test_year_totals_follow_archive_and_delete(self):
+        year = timezone.localtime().year
+        self.add('E1', 'incentive', '10.00')
+        generate_payroll()
+        first = archive_payroll()['run_id']
+        self.add('E1', 'deduction', '4.00')
+        self.add('E2', 'incentive', '1.00')
+        generate_payroll()
+        second = archive_payroll()['run_id']
+        totals = lambda: {
+            row[0]: row[1:] for row in EmployeeYearTotals.objects.filter(year=year)
+            .values_list('employee_id', 'run_count', 'total_incentives', 'total_deductions', 'total_final_salary')
+        }
+        self.assertEqual(totals(), {
+            'E1': (2, Decimal('10.00'), Decimal('4.00'), Decimal('2006.00')), 'E2': (1, Decimal('1.00'), Decimal('0.00'), Decimal('2001.00')),
+        })
+        summary = delete_payroll_run(second, chunk_size=1)
+        self.assertEqual((summary['archived_results'], summary['line_items']), (2, 2))
+        self.assertEqual(totals(), {'E1': (1, Decimal('10.00'), Decimal('0.00'), Decimal('1010.00'))})
+        # A retried deletion does not subtract the run a second time.
+        delete_payroll_run(second)
+        self.assertEqual(totals(), {'E1': (1, Decimal('10.00'), Decimal('0.00'), Decimal('1010.00'))})
+        delete_payroll_run(first)
+        self.assertEqual(totals(), {})
+        self.assertFalse(ArchivedPayrollResult.objects.exists() or PayrollLineItem.objects.exists() or PayrollRun.objects.exists())
+
+    def test_delete_run_in_chunks(self):
+        for employee_id in ('E1', 'E2'): self.add(employee_id, 'incentive', '1.00')
+        generate_payroll()
+        kept = archive_payroll()['run_id']
+        for employee_id in ('E1', 'E2'): self.add(employee_id, 'incentive', '2.00')
+        generate_payroll()
+        deleted = archive_payroll()['run_id']
+        summary = delete_payroll_run(deleted, chunk_size=1)
+        self.assertEqual((summary['archived_results'], summary['line_items']), (2, 2))
+        self.assertEqual(list(PayrollRun.objects.values_list('pk', flat=True)), [kept])
+        self.assertEqual(ArchivedPayrollResult.objects.filter(run_id=kept).count(), PayrollLineItem.objects.filter(run_id=kept).count())
+        self.assertFalse(ArchivedPayrollResult.objects.filter(run_id=deleted).exists())
+
+class ExportTests(PayrollTestCase):
+    """Current and archived results stream out as CSV blocks or a write-only XLSX workbook."""
+    def setUp(self):
+        for i, status in enumerate(['approved', 'pending', 'approved']):
+            employee = Employee.objects.create(employee_id=f'E{i}', name=f'Employee {i}', base_salary=Decimal('1000.00'))
+            PayrollResult.objects.create(employee=employee, total_incentives=Decimal(i), final_salary=Decimal('1000.00') + i, status=status)
+
+    def csv_rows(self, response):
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_csv_is_streamed_in_blocks(self):
+        with mock.patch('payroll.exports.EXPORT_CHUNK_SIZE', 2):
+            response = self.client.get('/api/payroll/results/export/csv/')
+            blocks = list(response.streaming_content)
+        self.assertEqual(len(blocks), 2)
+        rows = list(csv.reader(StringIO(b''.join(blocks).decode())))
+        self.assertEqual(rows[0][:6], ['employee_id', 'employee_name', 'base_salary', 'total_incentives', 'total_deductions', 'final_salary'])
+        self.assertEqual([row[:6] for row in rows[1:]], [
+            [f'E{i}', f'Employee {i}', '1000.00', f'{i}.00', '0.00', f'100{i}.00'] for i in range(3)
+        ])
+
+    def test_csv_status_filter(self):
+        rows = self.csv_rows(self.client.get('/api/payroll/results/export/csv/?status=approved'))
+        self.assertEqual([row[0] for row in rows[1:]], ['E0', 'E2'])
+
+    def test_archived_xlsx(self):
+        from openpyxl import load_workbook
+        run = PayrollRun.objects.create(run_name='October')
+        ArchivedPayrollResult.objects.create(
+            run=run, employee_id='E1', employee_name='Ann', base_salary=Decimal('1000.00'), total_incentives=Decimal('5.50'),
+            final_salary=Decimal('1005.50'), status='approved',
+        )
+        response = self.client.get(f'/api/payroll/history/{run.pk}/export/xlsx/')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="payroll_run_{run.pk}.xlsx"')
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True).worksheets[0]
+        header, row = sheet.iter_rows(values_only=True)
+        self.assertEqual(header[:3], ('employee_id', 'employee_name', 'base_salary'))
+        self.assertEqual((row[0], row[1], Decimal(str(row[5])), row[6]), ('E1', 'Ann', Decimal('1005.50'), 'approved'))
+
+    async def test_asgi_bodies_are_async_iterators(self):
+        # Django's ASGI handler would read a synchronous body into memory before sending it.
+        with mock.patch('payroll.exports.EXPORT_CHUNK_SIZE', 2):
+            response = await self.async_client.get('/api/payroll/results/export/csv/')
+            self.assertTrue(response.is_async)
+            blocks = [block async for block in response.streaming_content]
+        self.assertEqual(len(blocks), 2)
+        self.assertEqual(len(list(csv.reader(StringIO(b''.join(blocks).decode())))), 4)
+        response = await self.async_client.get('/api/payroll/results/export/xlsx/')
+        self.assertTrue(response.is_async)
+        self.assertTrue(response['Content-Length'])
+        self.assertEqual(len(b''.join([block async for block in response.streaming_content])), int(response['Content-Length']))
+
+    def test_unknown_format_and_run(self):
+        self.assertEqual(self.client.get('/api/payroll/results/export/pdf/').status_code, 400)
+        self.assertEqual(self.client.get('/api/payroll/history/999/export/csv/').status_code, 404)
+
+class PayrollRoundTripTests(UploadMixin, PayrollTestCase):
+    """Upload, generate, approve/reject, archive and delete through the API."""
+
+    def test_round_trip(self):
+        response = self.upload('/api/upload/employee/', 'employees.csv', 'employee_id,name,base_salary\nE1,Ann,1300\nE2,Bob,900\n')
+        self.assertEqual((response.status_code, response.json()['inserted']), (201, 2))
+        response = self.upload('/api/upload/component/', 'incentives.csv', 'employee_id,amount,reason\nE1,100.50,Bonus\nE2,25,Shift\nE9,1,Nobody\n', type='incentive')
+        self.assertEqual(response.status_code, 201)
+        upload, = response.json()['files']
+        self.assertEqual((upload['created'], upload['rejects']), (2, [{'line': 4, 'employee_id': 'E9', 'reason': 'unknown employee_id'}]))
+        self.assertEqual(self.client.post('/api/payroll/generate/').json()['employees'], 2)
+
+        ann, bob = (PayrollResult.objects.get(employee_id=employee_id).pk for employee_id in ('E1', 'E2'))
+        self.assertEqual(self.client.post(f'/api/payroll/approve/{ann}/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/payroll/reject/{bob}/', {}).status_code, 400)
+        self.assertEqual(self.client.post(f'/api/payroll/reject/{bob}/', {'reason': 'Check shifts'}).status_code, 200)
+        self.assertEqual(self.client.post(f'/api/payroll/approve/{bob}/').status_code, 404)
+
+        response = self.client.post('/api/payroll/archive/', {'run_name': 'October'})
+        self.assertEqual(response.status_code, 201)
+        run_id = response.json()['run_id']
+        self.assertEqual(self.client.post('/api/payroll/archive/').status_code, 400)
+        run, = self.client.get('/api/payroll/history/').json()
+        self.assertEqual((run['id'], run['headcount'], run['approved_count'], run['rejected_count']), (run_id, 2, 1, 1))
+        self.assertEqual((run['total_incentives'], run['total_final_salary']), ('125.50', '2325.50'))
+        history = self.client.get('/api/employees/E1/history/').json()
+        self.assertEqual((history['name'], history['recent']['runs'], history['runs'][0]['run_id']), ('Ann', 1, run_id))
+        self.assertEqual(history['years'][0]['run_count'], 1)
+        self.assertEqual((history['runs'][0]['final_salary'], history['recent']['total_final_salary']), ('1400.50', '1400.50'))
+        self.assertEqual(history['years'][0]['total_incentives'], '100.50')
+        self.assertEqual(self.client.get('/api/employees/E1/history/?runs=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/employees/E404/history/').status_code, 404)
+
+        response = self.client.delete(f'/api/payroll/history/{run_id}/delete/')
+        self.assertEqual((response.status_code, response.json()['archived_results'], response.json()['line_items']), (200, 2, 2))
+        self.assertEqual(self.client.get('/api/payroll/history/').json(), [])
+        self.assertEqual(self.client.get('/api/employees/E1/history/').json()['years'], [])
+        self.assertEqual(self.client.delete(f'/api/payroll/history/{run_id}/delete/').status_code, 404)
+
+    def test_oversized_amount_is_rejected(self):
+        self.upload('/api/upload/employee/', 'employees.csv', 'employee_id,name,base_salary\nE1,Ann,1300\n')
+        response = self.upload('/api/upload/component/', 'incentives.csv', 'employee_id,amount\nE1,12345678901\nE1,5\n', type='incentive')
+        upload, = response.json()['files']
+        self.assertEqual((upload['created'], upload['rejects']), (1, [{'line': 2, 'employee_id': 'E1', 'reason': 'invalid amount'}]))
+        self.assertEqual(self.client.get('/api/employees/').status_code, 200)
+
+    def test_sheets_are_parsed_in_spawned_workers(self):
+        self.upload('/api/upload/employee/', 'employees.csv', 'employee_id,name,base_salary\nE1,Ann,1300\nE2,Bob,900\n')
+        names = [
+            FileSystemStorage().save(name, ContentFile(content))
+            for name, content in (('a.csv', b'employee_id,amount\nE1,1\nE2,2\n'), ('b.csv', b'employee_id,amount\nE1,3\nE9,4\n'))
+        ]
+        report = process_component_files(names, 'incentive', workers=2)
+        self.assertEqual([(entry['status'], entry['cached'], entry['created']) for entry in report['files']], [('ok', False, 2), ('ok', False, 1)])
+        self.assertEqual(sorted(Component.objects.values_list('employee_id', 'amount')), [('E1', Decimal('1.00')), ('E1', Decimal('3.00')), ('E2', Decimal('2.00'))])
+
+class BulkActionTests(PayrollTestCase):
+    """Bulk approve/reject touch only the pending results picked by `ids` or by the list filters."""
+    def setUp(self):
+        super().setUp()
+        names = {'E1': 'Ann Sales', 'E2': 'Bob Sales', 'E3': 'Cid Support', 'E4': 'Dee Sales'}
+        for employee_id, name in names.items():
+            employee = Employee.objects.create(employee_id=employee_id, name=name)
+            PayrollResult.objects.create(employee=employee, final_salary=Decimal('100.00'), status='approved' if employee_id == 'E4' else 'pending')
+
+    def post(self, url, body):
+        return self.client.post(url, body, content_type='application/json')
+
+    def statuses(self):
+        return dict(PayrollResult.objects.values_list('employee_id', 'status'))
+
+    def test_approve_by_ids(self):
+        ids = list(PayrollResult.objects.filter(employee_id__in=['E1', 'E4']).values_list('id', flat=True))
+        response = self.post('/api/payroll/bulk/approve/', {'ids': ids})
+        self.assertEqual((response.status_code, response.json()['updated']), (200, 1))
+        self.assertEqual(self.statuses(), {'E1': 'approved', 'E2': 'pending', 'E3': 'pending', 'E4': 'approved'})
+
+    def test_reject_by_filter_needs_a_reason(self):
+        self.assertEqual(self.post('/api/payroll/bulk/reject/?search=sales', {}).status_code, 400)
+        response = self.post('/api/payroll/bulk/reject/?search=sales', {'reason': 'Missing timesheets'})
+        self.assertEqual(response.json()['updated'], 2)
+        self.assertEqual(self.statuses(), {'E1': 'rejected', 'E2': 'rejected', 'E3': 'pending', 'E4': 'approved'})
+        self.assertEqual(set(PayrollResult.objects.filter(status='rejected').values_list('rejection_reason', flat=True)), {'Missing timesheets'})
+
+    def test_requires_ids_or_a_filter(self):
+        self.assertEqual(self.post('/api/payroll/bulk/approve/', {}).status_code, 400)
+        self.assertEqual(self.post('/api/payroll/bulk/archive/', {'ids': [1]}).status_code, 400)
+        # Blank filters select every row, so they do not count as a filter.
+        self.assertEqual(self.post('/api/payroll/bulk/approve/?search=%20', {}).status_code, 400)
+        self.assertEqual(self.post('/api/payroll/bulk/approve/?status=%20&search=', {}).status_code, 400)
+        self.assertEqual(PayrollResult.objects.filter(status='pending').count(), 3)
+
+class EmployeeSearchTests(UploadMixin, PayrollTestCase):
+    """`?search=` prefix-matches every term against employee id and name tokens, and follows employee writes."""
+    def setUp(self):
+        super().setUp()
+        self.upload('/api/upload/employee/', 'employees.csv', 'employee_id,name\nE100,John Salazar\nE200,Mary Nair\nE300,Johanna Salt\n')
+        for employee in Employee.objects.all(): PayrollResult.objects.create(employee=employee, final_salary=Decimal('100.00'))
+
+    def search(self, terms):
+        rows = self.client.get('/api/payroll/results/', {'search': terms, 'fields': 'employee'}).json()
+        return sorted(row['employee']['employee_id'] for row in rows)
+
+    def test_terms_prefix_match_ids_and_names(self):
+        self.assertEqual(self.search('joh'), ['E100', 'E300'])
+        self.assertEqual(self.search('joh sal'), ['E100', 'E300'])
+        self.assertEqual(self.search('john salaz'), ['E100'])
+        self.assertEqual(self.search('E2'), ['E200'])
+        self.assertEqual(self.search('nobody'), [])
+        self.assertEqual(self.search('-'), [])
+
+    def test_index_follows_updates_deletes_and_upserts(self):
+        Employee.objects.filter(pk='E200').update(name='Mary Kowalski')
+        Employee.objects.filter(pk='E300').delete()
+        self.upload('/api/upload/employee/', 'employees.csv', 'employee_id,name\nE100,Jon Smith\nE400,Johnny Rossi\n')
+        PayrollResult.objects.create(employee_id='E400', final_salary=Decimal('100.00'))
+        self.assertEqual(self.search('nair'), [])
+        self.assertEqual(self.search('kowal'), ['E200'])
+        self.assertEqual(self.search('joh'), ['E400'])
+        self.assertEqual(self.search('smith'), ['E100'])
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT employee_id, name FROM payroll_employee_fts ORDER BY employee_id')
+                self.assertEqual(cursor.fetchall(), [('E100', 'Jon Smith'), ('E200', 'Mary Kowalski'), ('E400', 'Johnny Rossi')])
+
+class ListCacheTests(UploadMixin, PayrollTestCase):
+    """List responses carry an ETag, are served from the cache when repeated and change after every write."""
+    def setUp(self):
+        super().setUp()
+        employee = Employee.objects.create(employee_id='E1', name='Ann')
+        self.result = PayrollResult.objects.create(employee=employee, final_salary=Decimal('100.00'))
+
+    def test_repeat_is_served_from_the_cache_and_revalidates(self):
+        first = self.client.get('/api/payroll/results/')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/payroll/results/')
+            unchanged = self.client.get('/api/payroll/results/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((again.content, again['ETag']), (first.content, first['ETag']))
+        self.assertEqual((unchanged.status_code, unchanged.content), (304, b''))
+        self.assertNotEqual(self.client.get('/api/payroll/results/?status=pending')['ETag'], first['ETag'])
+
+    def test_single_row_write_invalidates(self):
+        before = self.client.get('/api/payroll/results/')
+        self.client.post(f'/api/payroll/approve/{self.result.pk}/')
+        after = self.client.get('/api/payroll/results/', HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(after.json()[0]['status'], 'approved')
+
+    def test_bulk_write_invalidates(self):
+        before = self.client.get('/api/employees/')
+        Employee.objects.filter(pk='E1').update(name='Ann Salazar')
+        self.assertEqual(self.client.get('/api/employees/').content, before.content)
+        bump_data_version()
+        self.assertEqual(self.client.get('/api/employees/').json()[0]['name'], 'Ann Salazar')
+        generate_payroll()
+        self.assertNotEqual(self.client.get('/api/employees/')['ETag'], before['ETag'])
+
+    def test_partly_committed_writes_invalidate(self):
+        before = self.client.get('/api/employees/')
+        name = FileSystemStorage().save('employees.csv', ContentFile(b'employee_id,name\nE1,Ann Salazar\nE2,Bob\n'))
+
+        def upsert_then_fail(employees, progress=None):
+            upsert_employees(employees[:1])
+            raise DatabaseError('connection lost')
+        with mock.patch('payroll.ingest.upsert_employees', upsert_then_fail), self.assertRaises(DatabaseError):
+            process_employee_sheet(name)
+        self.assertEqual([row['name'] for row in self.client.get('/api/employees/').json()], ['Ann Salazar'])
+        self.assertNotEqual(self.client.get('/api/employees/')['ETag'], before['ETag'])
+
+        generate_payroll()
+        run_id = archive_payroll()['run_id']
+        before = self.client.get('/api/payroll/history/')
+        with mock.patch('payroll.engine._delete_in_chunks', side_effect=[1, DatabaseError('connection lost')]), self.assertRaises(DatabaseError):
+            delete_payroll_run(run_id)
+        self.assertEqual(self.client.get('/api/payroll/history/', HTTP_IF_NONE_MATCH=before['ETag']).status_code, 200)
+
+class FastListTests(PayrollTestCase):
+    """The `.values()` fast path renders exactly the bytes the serializers and DRF's JSONRenderer produce."""
+    def setUp(self):
+        super().setUp()
+        Employee.objects.create(employee_id='E1', name='José\u2028Núñez', phone='555', age='30', base_salary=Decimal('1000.00'))
+        Employee.objects.create(employee_id='E2', name=None, base_salary=Decimal('0.10'))
+        for employee_id, component_type, amount in (('E1', 'incentive', '100.50'), ('E1', 'deduction', '3'), ('E2', 'incentive', '0.01')):
+            Component.objects.create(employee_id=employee_id, type=component_type, amount=Decimal(amount), reason='Shift', source_file='october.csv')
+        generate_payroll()
+        PayrollLineItem.objects.filter(employee_id='E1', type='incentive').update(attachment='attachments/receipt one.pdf')
+        PayrollResult.objects.filter(employee_id='E2').update(status='rejected', rejection_reason='Check\nagain')
+
+    def assertRendersLike(self, url, serializer):
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, JSONRenderer().render(serializer.data))
+
+    def test_results_list(self):
+        results = PayrollResult.objects.select_related('employee').all()
+        self.assertRendersLike('/api/payroll/results/', PayrollResultSerializer(results, many=True))
+        self.assertRendersLike('/api/payroll/results/?fields=id,final_salary,components_snapshot', PayrollResultSerializer(results, many=True, fields=['id', 'final_salary', 'components_snapshot']))
+
+    def test_archived_results_list(self):
+        run_id = archive_payroll()['run_id']
+        archived = ArchivedPayrollResult.objects.filter(run_id=run_id)
+        self.assertRendersLike(f'/api/payroll/history/{run_id}/', ArchivedPayrollResultSerializer(archived, many=True))
+
+    def test_indented_output_falls_back_to_drf(self):
+        data = PayrollResultSerializer(PayrollResult.objects.select_related('employee').all(), many=True).data
+        self.assertEqual(ORJSONRenderer().render(data, 'application/json; indent=2'), JSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_fast_rows_without_orjson(self):
+        url = '/api/payroll/results/'
+        expected = self.client.get(url).content
+        caches['default'].clear()
+        with mock.patch('payroll.renderers.orjson', None):
+            self.assertEqual(self.client.get(url).content, expected)
+        self.assertIn(b'"final_salary":"1097.50"', expected)
+
+class RunDiffTests(PayrollTestCase):
+    """Two archived runs are compared in SQL: added, removed and changed employees, sorted and paged."""
+    def setUp(self):
+        super().setUp()
+        self.base, self.other = PayrollRun.objects.create(run_name='September'), PayrollRun.objects.create(run_name='October')
+        self.archive(self.base, E1='1000.00', E2='2000.00', E3='500.00', E4='700.00')
+        self.archive(self.other, E1='1000.00', E2='2300.00', E3='450.00', E5='800.00')
+
+    def archive(self, run, **salaries):
+        ArchivedPayrollResult.objects.bulk_create([
+            ArchivedPayrollResult(run=run, employee_id=employee_id, employee_name=employee_id, base_salary=Decimal(salary), final_salary=Decimal(salary), status='pending')
+            for employee_id, salary in salaries.items()
+        ])
+
+    def test_changes_and_summary(self):
+        diff = run_diff(self.base.pk, self.other.pk)
+        self.assertEqual(diff['count'], 4)
+        self.assertEqual(
+            [(row['employee_id'], row['change'], row['final_salary']['delta']) for row in diff['results']],
+            [('E5', 'added', '800.00'), ('E4', 'removed', '-700.00'), ('E2', 'changed', '300.00'), ('E3', 'changed', '-50.00')],
+        )
+        self.assertEqual(diff['results'][0]['final_salary']['base'], None)
+        self.assertEqual(diff['summary']['changed'], {
+            'count': 2, 'base_salary': '250.00', 'total_incentives': '0.00', 'total_deductions': '0.00', 'final_salary': '250.00',
+        })
+        self.assertEqual([row['employee_id'] for row in run_diff(self.base.pk, self.other.pk, 'employee_id', 'changed')['results']], ['E2', 'E3'])
+
+    def test_paging_through_the_api(self):
+        url = f'/api/payroll/history/{self.base.pk}/diff/{self.other.pk}/?ordering=employee_id&page_size=3'
+        first = self.client.get(url).json()
+        self.assertEqual(([row['employee_id'] for row in first['results']], first['count'], first['previous']), (['E2', 'E3', 'E4'], 4, None))
+        second = self.client.get(first['next']).json()
+        self.assertEqual(([row['employee_id'] for row in second['results']], second['next']), (['E5'], None))
+        self.assertEqual((second['results'][0]['final_salary'], second['summary']['removed']['final_salary']), ({'base': None, 'other': '800.00', 'delta': '800.00'}, '-700.00'))
+        self.assertEqual(self.client.get(f'{url}&ordering=name').status_code, 400)
+        self.assertEqual(self.client.get(f'{url}&page=0').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/payroll/history/{self.base.pk}/diff/999/').status_code, 404)
+
+class AsyncViewTests(PayrollTestCase):
+    """The async read views answer plain JSON GETs like the DRF views and hand everything else to them."""
+    def setUp(self):
+        super().setUp()
+        Employee.objects.bulk_create([Employee(employee_id=f'E{i}', name=f'Emp {i}', base_salary=Decimal('100.00')) for i in range(3)])
+        PayrollResult.objects.bulk_create([
+            PayrollResult(employee_id=f'E{i}', total_incentives=Decimal('1.50'), final_salary=Decimal('101.50')) for i in range(3)
+        ])
+
+    def test_json_matches_the_drf_view(self):
+        drf = AsyncPayrollResultListView.sync_handler()
+        expected = drf(RequestFactory().get('/api/payroll/results/?status=pending')).render()
+        caches['default'].clear()
+        response = self.client.get('/api/payroll/results/?status=pending')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, expected['Content-Type']))
+        self.assertEqual(response.content, expected.content)
+        # Both views share the cache entry and its ETag.
+        request = RequestFactory().get('/api/payroll/results/?status=pending', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(drf(request).status_code, 304)
+
+    def test_other_requests_fall_back(self):
+        page = self.client.get('/api/payroll/results/?page_size=2').json()
+        self.assertEqual((len(page['results']), page['next'] is not None), (2, True))
+        self.assertEqual(len(self.client.get(page['next']).json()['results']), 1)
+        self.assertTrue(self.client.get('/api/payroll/results/?format=api')['Content-Type'].startswith('text/html'))
+        self.assertTrue(self.client.get('/api/employees/', HTTP_ACCEPT='text/html')['Content-Type'].startswith('text/html'))
+        self.assertEqual(self.client.get('/api/jobs/999/').status_code, 404)
+        self.assertEqual(self.client.get('/api/employees/E404/history/').status_code, 404)
+        self.assertEqual(self.client.get('/api/employees/E1/history/?runs=x').status_code, 400)
+        self.assertEqual(self.client.get('/api/employees/E1/history/').json()['runs'], [])
+
+class AttachmentTests(UploadMixin, PayrollTestCase):
+    """Attachments are stored once per content and served with validators and single byte ranges."""
+    BODY = b'%PDF-1.4 0123456789'
+
+    def setUp(self):
+        super().setUp()
+        self.name = attachment_storage().save('scan.pdf', SimpleUploadedFile('scan.pdf', self.BODY))
+        self.url = attachment_storage().url(self.name)
+
+    def test_identical_uploads_share_a_blob(self):
+        self.assertTrue(self.name.startswith('attachments/blobs/'))
+        self.assertEqual(attachment_storage().save('copy.pdf', SimpleUploadedFile('copy.pdf', self.BODY)), self.name)
+        attachment_storage().delete(self.name)
+        self.assertTrue(attachment_storage().exists(self.name))
+
+    def test_full_body_and_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.BODY)
+        self.assertEqual((response['Accept-Ranges'], response['Content-Disposition']), ('bytes', 'inline'))
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, response.content), (304, b''))
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=9-12')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'0123')
+        self.assertEqual(response['Content-Range'], f'bytes 9-12/{len(self.BODY)}')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), b'6789')
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.BODY)}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.BODY)}'))
+        response = self.client.get(self.url, HTTP_RANGE='bytes=9-12', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, self.BODY))
+
+    async def test_asgi_bodies_are_async_iterators(self):
+        response = await self.async_client.get(self.url)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.BODY)
+        response = await self.async_client.get(self.url, headers={'Range': 'bytes=9-12'})
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'0123')
+
+    def test_paths_outside_attachments_are_refused(self):
+        self.assertEqual(self.client.get('/api/attachments/../../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/api/attachments/missing.pdf').status_code, 404)
+
+class ParserParityTests(SimpleTestCase):
+    """The pandas and stdlib readers of a sheet agree on rows, values, rejects and sheet line numbers."""
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.workdir = Path(workdir.name)
+
+    def test_employee_master(self):
+        path = self.workdir / 'employees.csv'
+        path.write_text(EMPLOYEE_CSV)
+        employees, rejects, rows_read = read_employee_csv(str(path))
+        df = read_spreadsheet(str(path))
+        frame, frame_rejects = prepare_employee_frame(df)
+        self.assertEqual(employees, EMPLOYEES)
+        self.assertEqual(rejects, EMPLOYEE_REJECTS)
+        self.assertEqual(list(frame.itertuples(index=False, name=None)), EMPLOYEES)
+        self.assertEqual(frame_rejects, EMPLOYEE_REJECTS)
+        self.assertEqual(rows_read, len(df))
+
+    def test_component_sheet(self):
+        csv_path = _write_csv(self.workdir / 'components.csv', COMPONENT_SHEET)
+        xlsx_path = _write_xlsx(self.workdir / 'components.xlsx', COMPONENT_SHEET)
+        self.assertEqual(list(chain.from_iterable(iter_component_rows(csv_path, chunk_size=2))), COMPONENT_ROWS)
+        self.assertEqual(normalize_component_chunk(read_spreadsheet(csv_path)), COMPONENT_ROWS)
+        self.assertEqual(list(chain.from_iterable(iter_component_rows(xlsx_path, chunk_size=2))), COMPONENT_ROWS)
+
+class ParseCacheTests(SimpleTestCase):
+    """Parsed sheets are cached under the parser version, so entries of an older parser are never read back."""
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def test_entries_are_versioned(self):
+        rows = [(2, 'E1', Decimal('10.01'), 'Bonus'), (4, None, None, None)]
+        with parse_cache.writer('abc') as entry: entry.write(rows)
+        self.assertEqual(list(chain.from_iterable(parse_cache.load('abc', 1))), rows)
+        old = parse_cache.cache_dir() / 'abc.csv.gz'
+        parse_cache._entry('abc').rename(old)
+        self.assertFalse(parse_cache.contains('abc'))
+        self.assertIsNone(parse_cache.load('abc', 1))
+        with parse_cache.writer('def') as entry: entry.write(rows)
+        self.assertFalse(old.exists())
+        self.assertTrue(parse_cache.contains('def'))
+
+class LineItemMigrationTests(TransactionTestCase):
+    """0010 moves components snapshots into PayrollLineItem rows, and back when reversed."""
+    before, after = [('payroll', '0009_keyset_indexes')], [('payroll', '0010_payrolllineitem')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_snapshots_round_trip(self):
+        apps = self.migrate(self.before)
+        employee = apps.get_model('payroll', 'Employee').objects.create(employee_id='E1', name='Ann', base_salary=Decimal('1000.00'))
+        snapshot = {
+            'incentives': [{'amount': '100.50', 'reason': 'Bonus', 'source_file': 'october.csv', 'attachment_url': '/media/attachments/receipt.pdf'}],
+            'deductions': [{'amount': '20.00', 'reason': None, 'source_file': None, 'attachment_url': None}],
+        }
+        result = apps.get_model('payroll', 'PayrollResult').objects.create(
+            employee=employee, total_incentives=Decimal('100.50'), total_deductions=Decimal('20.00'), final_salary=Decimal('1080.50'),
+            components_snapshot=snapshot,
+        )
+        run = apps.get_model('payroll', 'PayrollRun').objects.create(run_name='September')
+        archived = apps.get_model('payroll', 'ArchivedPayrollResult').objects.create(
+            run=run, employee_id='E1', employee_name='Ann', final_salary=Decimal('1050.00'), status='approved',
+            components_snapshot={'incentives': [{'amount': '50', 'reason': 'Shift'}], 'deductions': []},
+        )
+
+        apps = self.migrate(self.after)
+        LineItem = apps.get_model('payroll', 'PayrollLineItem')
+        self.assertEqual(
+            sorted(LineItem.objects.filter(result_id=result.pk).values_list('type', 'amount', 'reason', 'source_file', 'attachment', 'employee_id')),
+            [('deduction', Decimal('20.00'), None, None, '', 'E1'), ('incentive', Decimal('100.50'), 'Bonus', 'october.csv', 'attachments/receipt.pdf', 'E1')],
+        )
+        self.assertEqual(
+            list(LineItem.objects.filter(archived_result_id=archived.pk).values_list('run_id', 'type', 'amount', 'reason')),
+            [(run.pk, 'incentive', Decimal('50.00'), 'Shift')],
+        )
+
+        apps = self.migrate(self.before)
+        self.assertEqual(apps.get_model('payroll', 'PayrollResult').objects.get().components_snapshot, snapshot)
+        self.assertEqual(
+            apps.get_model('payroll', 'ArchivedPayrollResult').objects.get().components_snapshot,
+            {'incentives': [{'amount': '50.00', 'reason': 'Shift', 'source_file': None, 'attachment_url': None}], 'deductions': []},
+        )
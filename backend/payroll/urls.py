@@ -2,26 +2,49 @@
 from django.urls import path
 from .views import (
     UploadEmployeeSheetView, UploadComponentSheetView, ManualComponentView,
-    EmployeeListView, GeneratePayrollView, PayrollResultListView,
-    ApprovePayrollView, RejectPayrollView, PayrollRunListView, 
-    ArchivedResultListView, ArchivePayrollView,
+    GeneratePayrollView,
+    ApprovePayrollView, RejectPayrollView,
+    ArchivePayrollView,
     # NEW: Import the delete view
     DeletePayrollRunView,
+    PayrollResultDetailView, ArchivedResultDetailView, PayrollLineItemListView,
+    ExportPayrollResultsView, ExportArchivedResultsView, BulkPayrollActionView, MetricsView,
+    AttachmentView, RunDiffView,
+)
+from .async_views import (
+    AsyncEmployeeListView, AsyncPayrollResultListView, AsyncPayrollRunListView, AsyncArchivedResultListView,
+    AsyncJobDetailView, AsyncEmployeeHistoryView, offloaded,
 )
 
 urlpatterns = [
-    path('upload/employee/', UploadEmployeeSheetView.as_view()),
-    path('upload/component/', UploadComponentSheetView.as_view()),
+    path('upload/employee/', offloaded(UploadEmployeeSheetView)),
+    path('upload/component/', offloaded(UploadComponentSheetView)),
     path('components/manual-add/', ManualComponentView.as_view()),
-    path('employees/', EmployeeListView.as_view()),
-    path('payroll/generate/', GeneratePayrollView.as_view()),
-    path('payroll/results/', PayrollResultListView.as_view()),
+    path('employees/', AsyncEmployeeListView.as_view()),
+    # One employee's recent archived runs and per-year cumulative totals
+    path('employees/<str:employee_id>/history/', AsyncEmployeeHistoryView.as_view(), name='employee-history'),
+    path('payroll/generate/', offloaded(GeneratePayrollView)),
+    path('payroll/results/', AsyncPayrollResultListView.as_view()),
+    path('payroll/results/<int:pk>/', PayrollResultDetailView.as_view()),
+    path('payroll/results/export/<str:file_format>/', ExportPayrollResultsView.as_view()),
+    path('payroll/line-items/', PayrollLineItemListView.as_view()),
     path('payroll/approve/<int:id>/', ApprovePayrollView.as_view()),
     path('payroll/reject/<int:id>/', RejectPayrollView.as_view()),
-    path('payroll/archive/', ArchivePayrollView.as_view()),
-    path('payroll/history/', PayrollRunListView.as_view()),
-    path('payroll/history/<int:run_id>/', ArchivedResultListView.as_view()),
+    path('payroll/bulk/<str:action>/', BulkPayrollActionView.as_view()),
+    path('payroll/archive/', offloaded(ArchivePayrollView)),
+    path('payroll/history/', AsyncPayrollRunListView.as_view()),
+    path('payroll/history/<int:run_id>/', AsyncArchivedResultListView.as_view()),
+    path('payroll/history/<int:run_id>/results/<int:pk>/', ArchivedResultDetailView.as_view()),
+    path('payroll/history/<int:run_id>/export/<str:file_format>/', ExportArchivedResultsView.as_view()),
+    path('payroll/history/<int:run_id>/diff/<int:other_run_id>/', RunDiffView.as_view(), name='payroll-run-diff'),
     
     # NEW: URL pattern for deleting a historical payroll run
     path('payroll/history/<int:pk>/delete/', DeletePayrollRunView.as_view(), name='delete-payroll-run'),
+
+    # Status of a background upload/generate/archive job queued with ?async=1
+    path('jobs/<int:pk>/', AsyncJobDetailView.as_view(), name='job-detail'),
+    # Prometheus text-format request metrics of this process
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    # Content-addressed manual-entry attachments (Range/conditional requests, optional X-Sendfile/X-Accel offload)
+    path('attachments/<path:name>', AttachmentView.as_view(), name='attachment'),
 ]
@@ -1,28 +1,117 @@
 # payroll/views.py
-from rest_framework import generics, status, views, filters
+from rest_framework import generics, status, views
 from rest_framework.response import Response
-import pandas as pd
-from django.db import transaction
-from .models import Employee, Component, PayrollResult, PayrollRun, ArchivedPayrollResult
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .models import Employee, Component, PayrollResult, PayrollRun, ArchivedPayrollResult, Job, PayrollLineItem
 from .serializers import (
     EmployeeSerializer, ManualComponentSerializer, PayrollResultSerializer, 
-    RejectPayrollSerializer, PayrollRunSerializer, ArchivedPayrollResultSerializer
+    RejectPayrollSerializer, BulkPayrollActionSerializer, PayrollRunSerializer, ArchivedPayrollResultSerializer, JobSerializer,
+    PayrollLineItemSerializer,
 )
-import re
-from decimal import Decimal, InvalidOperation
 from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views import View
 from django_filters.rest_framework import DjangoFilterBackend
+from .engine import generate_payroll, archive_payroll, delete_payroll_run, NothingToArchive
+from .ingest import process_employee_sheet, process_component_files, MissingColumnsError
+from .exports import EXPORTERS, RESULT_COLUMNS, ARCHIVED_RESULT_COLUMNS
+from .jobs import enqueue
+from .pagination import KeysetPagination
+from .search import EmployeeSearchFilter
+from .metrics import REGISTRY
+from .renderers import list_renderer_classes
+from .rows import RESULT_VALUES, ARCHIVED_RESULT_VALUES, result_row, archived_result_row, snapshots
+from .caching import LIST_CACHE_TIMEOUT, bump_data_version, list_cache, list_cache_key
+from .serving import serve_attachment
+from .history import HISTORY_RUNS, HISTORY_MAX_RUNS, DIFF_ORDERINGS, DIFF_CHANGES, employee_history, run_diff
 
-def clean_and_convert_to_decimal(value):
-    if value is None: return None
-    cleaned_value = re.sub(r'[^\d.-]', '', str(value))
-    if not cleaned_value: return None
-    try: return Decimal(cleaned_value)
-    except InvalidOperation: return None
+class LeanListMixin:
+    """
+    Shared by the large list endpoints: opt-in keyset pagination, `?fields=a,b` to return only those
+    fields and `?summary=1` to leave out the heavy ones. `summary_prefetch` maps each heavy field to the
+    prefetch that feeds it, which is skipped when the field is not returned.
+    """
+    pagination_class = KeysetPagination
+    summary_prefetch = {}
 
-def read_spreadsheet(file_path):
-    try: return pd.read_csv(file_path, dtype=str) if file_path.endswith('.csv') else pd.read_excel(file_path, dtype=str)
-    except Exception as e: raise ValueError(f"Could not read file: {e}")
+    def selected_fields(self):
+        params = self.request.query_params
+        requested = [name.strip() for name in params.get('fields', '').split(',') if name.strip()]
+        summary = params.get('summary', '').lower() in ('1', 'true', 'yes')
+        if not requested and not summary: return None
+        return [
+            name for name in self.get_serializer_class()().fields
+            if (not requested or name in requested) and not (summary and name in self.summary_prefetch)
+        ]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.selected_fields()
+        lookups = [lookup for name, lookup in self.summary_prefetch.items() if fields is None or name in fields]
+        return queryset.prefetch_related(*lookups) if lookups else queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.selected_fields())
+        return super().get_serializer(*args, **kwargs)
+
+class CachedListMixin:
+    """
+    Caches rendered list responses per payroll data version and URL and tags them with an ETag.
+    A matching If-None-Match gets a 304 and a repeated URL is served from the cache, both without
+    touching the database or the serializers. Every write bumps the version (see payroll.caching).
+    """
+    def get(self, request, *args, **kwargs):
+        self.list_cache_key, self.etag = list_cache_key(request)
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if self.etag in if_none_match or '*' in if_none_match:
+            self.list_cache_key = None
+            return HttpResponseNotModified()
+        cached = list_cache().get(self.list_cache_key)
+        if cached is None: return super().get(request, *args, **kwargs)
+        self.list_cache_key = None
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) is None or response.status_code not in (200, 304): return response
+        if self.list_cache_key and isinstance(response, Response):
+            response.render()
+            list_cache().set(self.list_cache_key, (response.content, response['Content-Type']), LIST_CACHE_TIMEOUT)
+        response['ETag'] = self.etag
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+class FastListMixin:
+    """
+    With the JSON or MessagePack renderer, lists are built straight from `.values()` (payroll.rows)
+    instead of the serializer; the output is identical. `fast_values` are the columns, `fast_row` builds
+    one item and `snapshot_owner` is the line item field pointing at the listed model.
+    """
+    renderer_classes = list_renderer_classes()
+
+    def list(self, request, *args, **kwargs):
+        if not getattr(request.accepted_renderer, 'fast_rows', False): return super().list(request, *args, **kwargs)
+        fields = self.selected_fields()
+        rows = self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*self.fast_values)
+        page = self.paginate_queryset(rows)
+        owners = [values['id'] for values in page] if page is not None else rows.values('id')
+        by_owner = snapshots(self.snapshot_owner, owners) if fields is None or 'components_snapshot' in fields else {}
+        data = [self.fast_row(values, by_owner) for values in (page if page is not None else rows)]
+        if fields is not None: data = [{name: row[name] for name in fields} for row in data]
+        return self.get_paginated_response(data) if page is not None else Response(data)
+
+def run_in_background(request):
+    """True when the client asked for the work to be queued (`?async=1` or an `async` form field)."""
+    flag = request.query_params.get('async') or request.data.get('async') or ''
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+def enqueue_response(kind, **payload):
+    job = enqueue(kind, **payload)
+    return Response({'message': 'Job queued.', 'job_id': job.id, 'status_url': f'/api/jobs/{job.id}/'}, status=status.HTTP_202_ACCEPTED)
 
 class UploadEmployeeSheetView(views.APIView):
     def post(self, request, *args, **kwargs):
@@ -30,18 +119,11 @@ class UploadEmployeeSheetView(views.APIView):
         if not file: return Response({'error': 'No employee master file provided.'}, status=status.HTTP_400_BAD_REQUEST)
         fs = FileSystemStorage()
         filename = fs.save(file.name, file)
+        if run_in_background(request): return enqueue_response('upload_employee', filename=filename)
         try:
-            df = read_spreadsheet(fs.path(filename))
-            if 'employee_id' not in df.columns: return Response({'error': "Master file must have 'employee_id' column."}, status=status.HTTP_400_BAD_REQUEST)
-            with transaction.atomic():
-                for _, row in df.iterrows():
-                    if pd.isna(row.get('employee_id')): continue
-                    base_salary = clean_and_convert_to_decimal(row.get('base_salary')) or Decimal('0.00')
-                    Employee.objects.update_or_create(
-                        employee_id=str(row['employee_id']).strip(),
-                        defaults={'name': str(row.get('name', '')).strip(), 'base_salary': base_salary}
-                    )
-            return Response({'message': 'Employee master sheet processed.'}, status=status.HTTP_201_CREATED)
+            return Response(process_employee_sheet(filename), status=status.HTTP_201_CREATED)
+        except MissingColumnsError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -50,26 +132,10 @@ class UploadComponentSheetView(views.APIView):
         files, component_type = request.FILES.getlist('files'), request.data.get('type')
         if not files or component_type not in ['incentive', 'deduction']:
             return Response({'error': 'Files and a valid type are required.'}, status=status.HTTP_400_BAD_REQUEST)
-        valid_employee_ids = set(Employee.objects.values_list('employee_id', flat=True))
-        components_to_create = []
-        for file in files:
-            try:
-                fs = FileSystemStorage()
-                filename = fs.save(file.name, file)
-                df = read_spreadsheet(fs.path(filename))
-                if not {'employee_id', 'amount'}.issubset(df.columns): continue
-                for _, row in df.iterrows():
-                    emp_id = str(row.get('employee_id')).strip() if pd.notna(row.get('employee_id')) else None
-                    amount = clean_and_convert_to_decimal(row.get('amount'))
-                    if emp_id in valid_employee_ids and amount is not None:
-                        components_to_create.append(
-                            Component(employee_id=emp_id, type=component_type, amount=amount, reason=row.get('reason'), source_file=filename)
-                        )
-            except Exception:
-                continue
-        if components_to_create:
-            with transaction.atomic(): Component.objects.bulk_create(components_to_create)
-        return Response({'message': f'{len(components_to_create)} {component_type} records processed.'}, status=status.HTTP_201_CREATED)
+        fs = FileSystemStorage()
+        filenames = [fs.save(file.name, file) for file in files]
+        if run_in_background(request): return enqueue_response('upload_component', filenames=filenames, type=component_type)
+        return Response(process_component_files(filenames, component_type), status=status.HTTP_201_CREATED)
 
 class ManualComponentView(generics.CreateAPIView):
     queryset = Component.objects.all()
@@ -77,83 +143,95 @@ class ManualComponentView(generics.CreateAPIView):
     def perform_create(self, serializer):
         serializer.save(type='incentive', source_file='Manual Entry')
 
-class EmployeeListView(generics.ListAPIView):
+class EmployeeListView(CachedListMixin, LeanListMixin, generics.ListAPIView):
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
+    cursor_ordering = ('employee_id',)
 
 class GeneratePayrollView(views.APIView):
     def post(self, request, *args, **kwargs):
-        with transaction.atomic():
-            employees_with_new_components = Employee.objects.filter(components__isnull=False).distinct()
-            for emp in employees_with_new_components:
-                result, created = PayrollResult.objects.get_or_create(
-                    employee=emp,
-                    defaults={'final_salary': emp.base_salary or Decimal('0.00'), 'total_incentives': 0, 'total_deductions': 0, 'components_snapshot': {'incentives': [], 'deductions': []}}
-                )
-                
-                # MODIFIED: Get full component objects to access attachment URLs
-                new_incentives = emp.components.filter(type='incentive')
-                new_deductions = emp.components.filter(type='deduction')
-                
-                new_total_incentives = sum(i.amount for i in new_incentives)
-                new_total_deductions = sum(d.amount for d in new_deductions)
-                
-                result.total_incentives += new_total_incentives
-                result.total_deductions += new_total_deductions
-                result.final_salary = (emp.base_salary or 0) + result.total_incentives - result.total_deductions
-                
-                snapshot = result.components_snapshot
-                # MODIFIED: Add attachment_url to the snapshot if an attachment exists
-                snapshot['incentives'].extend([{'amount': str(i.amount), 'reason': i.reason, 'source_file': i.source_file, 'attachment_url': i.attachment.url if i.attachment else None} for i in new_incentives])
-                snapshot['deductions'].extend([{'amount': str(d.amount), 'reason': d.reason, 'source_file': d.source_file, 'attachment_url': d.attachment.url if d.attachment else None} for d in new_deductions])
-                result.components_snapshot = snapshot
-
-                result.save()
-            Component.objects.all().delete()
-        return Response({'message': 'Payroll updated with new components.'}, status=status.HTTP_201_CREATED)
+        if run_in_background(request): return enqueue_response('generate')
+        stats = generate_payroll()
+        return Response({'message': 'Payroll updated with new components.', **stats}, status=status.HTTP_201_CREATED)
 
 class ArchivePayrollView(views.APIView):
     def post(self, request, *args, **kwargs):
-        with transaction.atomic():
-            current_results = PayrollResult.objects.select_related('employee').all()
-            if not current_results.exists():
-                return Response({'message': 'No current payroll results to archive.'}, status=status.HTTP_400_BAD_REQUEST)
-            run_name = request.data.get('run_name', None)
-            new_run = PayrollRun.objects.create(run_name=run_name)
-            archives_to_create = []
-            for result in current_results:
-                archives_to_create.append(
-                    ArchivedPayrollResult(
-                        run=new_run, employee_id=result.employee.employee_id, employee_name=result.employee.name,
-                        base_salary=result.employee.base_salary, total_incentives=result.total_incentives,
-                        total_deductions=result.total_deductions, final_salary=result.final_salary,
-                        status=result.status, rejection_reason=result.rejection_reason,
-                        components_snapshot=result.components_snapshot
-                    )
-                )
-            ArchivedPayrollResult.objects.bulk_create(archives_to_create)
-            current_results.delete()
-        return Response({'message': f'Successfully archived payroll run. The dashboard is now clear.'}, status=status.HTTP_201_CREATED)
-
-class PayrollResultListView(generics.ListAPIView):
-    queryset = PayrollResult.objects.select_related('employee').all()
-    serializer_class = PayrollResultSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+        run_name = request.data.get('run_name', None)
+        if run_in_background(request): return enqueue_response('archive', run_name=run_name)
+        try:
+            return Response(archive_payroll(run_name), status=status.HTTP_201_CREATED)
+        except NothingToArchive as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class PayrollResultFilterMixin:
+    """The `?status=` / `?search=` filtering of the results list, shared with the bulk actions."""
+    filter_backends = [DjangoFilterBackend, EmployeeSearchFilter]
     filterset_fields = ['status']
     search_fields = ['employee__name', 'employee__employee_id']
 
-class PayrollRunListView(generics.ListAPIView):
+class PayrollResultListView(CachedListMixin, FastListMixin, PayrollResultFilterMixin, LeanListMixin, generics.ListAPIView):
+    queryset = PayrollResult.objects.select_related('employee').all()
+    serializer_class = PayrollResultSerializer
+    fast_values, fast_row, snapshot_owner = RESULT_VALUES, staticmethod(result_row), 'result'
+    cursor_ordering = ('-created_at', '-id')
+    summary_prefetch = {'components_snapshot': 'line_items'}
+
+class PayrollResultDetailView(generics.RetrieveAPIView):
+    queryset = PayrollResult.objects.select_related('employee').prefetch_related('line_items')
+    serializer_class = PayrollResultSerializer
+
+class PayrollRunListView(CachedListMixin, LeanListMixin, generics.ListAPIView):
     queryset = PayrollRun.objects.all()
     serializer_class = PayrollRunSerializer
+    cursor_ordering = ('-run_timestamp', '-id')
 
 class DeletePayrollRunView(generics.DestroyAPIView):
     queryset = PayrollRun.objects.all()
+    def destroy(self, request, *args, **kwargs):
+        run = self.get_object()
+        return Response(delete_payroll_run(run.pk), status=status.HTTP_200_OK)
 
-class ArchivedResultListView(generics.ListAPIView):
+class ArchivedResultListView(CachedListMixin, FastListMixin, LeanListMixin, generics.ListAPIView):
+    queryset = ArchivedPayrollResult.objects.all()
     serializer_class = ArchivedPayrollResultSerializer
+    fast_values, fast_row, snapshot_owner = ARCHIVED_RESULT_VALUES, staticmethod(archived_result_row), 'archived_result'
+    cursor_ordering = ('id',)
+    summary_prefetch = {'components_snapshot': 'line_items'}
     def get_queryset(self):
-        run_id = self.kwargs['run_id']
-        return ArchivedPayrollResult.objects.filter(run_id=run_id)
+        return super().get_queryset().filter(run_id=self.kwargs['run_id'])
+
+class ArchivedResultDetailView(generics.RetrieveAPIView):
+    serializer_class = ArchivedPayrollResultSerializer
+    def get_queryset(self):
+        return ArchivedPayrollResult.objects.filter(run_id=self.kwargs['run_id']).prefetch_related('line_items')
+
+class PayrollLineItemListView(LeanListMixin, generics.ListAPIView):
+    """Indexed component queries, e.g. `?source_file=x.csv` or `?type=deduction&amount__gt=1000`."""
+    queryset = PayrollLineItem.objects.order_by('id')
+    serializer_class = PayrollLineItemSerializer
+    filterset_fields = {
+        'source_file': ['exact'], 'type': ['exact'], 'employee_id': ['exact'], 'run': ['exact'],
+        'result': ['exact'], 'amount': ['exact', 'gt', 'gte', 'lt', 'lte'],
+    }
+    cursor_ordering = ('id',)
+
+def export_response(request, queryset, file_format, filename, columns):
+    exporter = EXPORTERS.get(file_format)
+    if exporter is None: return Response({'error': "Format must be 'csv' or 'xlsx'."}, status=status.HTTP_400_BAD_REQUEST)
+    return exporter(request, queryset, columns, filename)
+
+class ExportPayrollResultsView(views.APIView):
+    def get(self, request, file_format, *args, **kwargs):
+        queryset = PayrollResult.objects.order_by('employee_id')
+        if request.query_params.get('status'): queryset = queryset.filter(status=request.query_params['status'])
+        return export_response(request, queryset, file_format, 'payroll_results', RESULT_COLUMNS)
+
+class ExportArchivedResultsView(views.APIView):
+    def get(self, request, run_id, file_format, *args, **kwargs):
+        run = generics.get_object_or_404(PayrollRun, id=run_id)
+        queryset = ArchivedPayrollResult.objects.filter(run=run).order_by('employee_id')
+        if request.query_params.get('status'): queryset = queryset.filter(status=request.query_params['status'])
+        return export_response(request, queryset, file_format, f'payroll_run_{run.id}', ARCHIVED_RESULT_COLUMNS)
 
 class ApprovePayrollView(views.APIView):
     def post(self, request, id, *args, **kwargs):
@@ -172,3 +250,96 @@ class RejectPayrollView(views.APIView):
             result.save()
             return Response({'message': 'Payroll rejected.'}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class BulkPayrollActionView(PayrollResultFilterMixin, generics.GenericAPIView):
+    """
+    Approves or rejects many pending results with one UPDATE. The rows are picked either by `ids` in the
+    body or by the results list's query parameters, e.g. `?status=pending&search=sales`.
+    """
+    queryset = PayrollResult.objects.all()
+    serializer_class = BulkPayrollActionSerializer
+    bulk_actions = ('approve', 'reject')
+
+    def has_filters(self, request):
+        """True when `?status=` or `?search=` narrows the rows; blank or whitespace-only values filter nothing."""
+        return bool(request.query_params.get('status', '').strip() or EmployeeSearchFilter().get_search_terms(request))
+
+    def post(self, request, action, *args, **kwargs):
+        if action not in self.bulk_actions: return Response({'error': "Action must be 'approve' or 'reject'."}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids, reason = serializer.validated_data.get('ids'), serializer.validated_data.get('reason')
+        if not ids and not self.has_filters(request):
+            return Response({'error': 'Provide ids or at least one filter (status, search).'}, status=status.HTTP_400_BAD_REQUEST)
+        if action == 'reject' and not reason:
+            return Response({'reason': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset())
+        if ids: queryset = queryset.filter(id__in=ids)
+        changes = {'status': 'approved'} if action == 'approve' else {'status': 'rejected', 'rejection_reason': reason}
+        updated = PayrollResult.objects.filter(id__in=queryset.filter(status='pending').values('id')).update(**changes)
+        bump_data_version()
+        return Response({'message': f'{updated} payroll results updated.', 'updated': updated}, status=status.HTTP_200_OK)
+
+class RunDiffView(views.APIView):
+    """
+    Employees added, removed or changed in run `other_run_id` compared with run `run_id`, computed in the database.
+    `?ordering=` picks the amount whose absolute delta sorts the rows (default final_salary, or employee_id),
+    `?change=` keeps one kind of change, and `?page=`/`?page_size=` page through the result.
+    """
+    page_size, max_page_size = 100, 1000
+
+    def get(self, request, run_id, other_run_id, *args, **kwargs):
+        params = request.query_params
+        ordering, change = params.get('ordering', 'final_salary'), params.get('change') or None
+        if ordering not in DIFF_ORDERINGS:
+            return Response({'error': f"ordering must be one of {', '.join(DIFF_ORDERINGS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        if change is not None and change not in DIFF_CHANGES:
+            return Response({'error': f"change must be one of {', '.join(DIFF_CHANGES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page, page_size = int(params.get('page', 1)), int(params.get('page_size', self.page_size))
+        except ValueError:
+            page = page_size = 0
+        if page < 1 or not 1 <= page_size <= self.max_page_size:
+            return Response({'error': f'page must be positive and page_size between 1 and {self.max_page_size}.'}, status=status.HTTP_400_BAD_REQUEST)
+        if PayrollRun.objects.filter(pk__in=[run_id, other_run_id]).count() != len({run_id, other_run_id}):
+            return Response({'error': 'Payroll run not found.'}, status=status.HTTP_404_NOT_FOUND)
+        diff = run_diff(run_id, other_run_id, ordering, change, page_size, (page - 1) * page_size)
+        url = request.build_absolute_uri()
+        next_url = replace_query_param(url, 'page', page + 1) if page * page_size < diff['count'] else None
+        previous_url = None if page == 1 else remove_query_param(url, 'page') if page == 2 else replace_query_param(url, 'page', page - 1)
+        return Response({'next': next_url, 'previous': previous_url, **diff})
+
+class EmployeeHistoryView(views.APIView):
+    """An employee's last `?runs=N` archived results (default 12) with their totals and the per-year cumulative totals."""
+    def requested_runs(self):
+        """`?runs=`, or None unless it is a number from 1 to HISTORY_MAX_RUNS."""
+        try:
+            runs = int(self.request.query_params.get('runs', HISTORY_RUNS))
+        except ValueError:
+            return None
+        return runs if 1 <= runs <= HISTORY_MAX_RUNS else None
+
+    def get(self, request, employee_id, *args, **kwargs):
+        runs = self.requested_runs()
+        if runs is None:
+            return Response({'error': f'runs must be between 1 and {HISTORY_MAX_RUNS}.'}, status=status.HTTP_400_BAD_REQUEST)
+        history = employee_history(employee_id, runs)
+        if history is None: return Response({'error': 'Employee not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(history)
+
+class JobDetailView(generics.RetrieveAPIView):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+
+class MetricsView(views.APIView):
+    """Request latency, query and row histograms of this process in Prometheus text format."""
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class AttachmentView(View):
+    """
+    Manual-entry attachments, with Range and conditional requests. A plain Django view, so no content negotiation
+    gets in the way of PDF viewers and download managers.
+    """
+    def get(self, request, name, *args, **kwargs):
+        return serve_attachment(request, name)